@@ -0,0 +1,63 @@
+import argparse
+import json
+import time
+import rpc_codec
+
+# Calls timed per measurement, and measurements per case (the best is reported)
+ITERATIONS = 20_000
+REPEATS = 5
+
+
+def legacy_roundtrip(body, response):
+    """The codec path before rpc_codec: decode + json.loads, json.dumps + encode."""
+    json.loads(body.decode('utf-8'))
+    return json.dumps(response).encode('utf-8')
+
+
+def codec_roundtrip(body, response):
+    rpc_codec.loads(body)
+    return rpc_codec.encode_response(response)
+
+
+def cpu_per_call(func, args, iterations=ITERATIONS, repeats=REPEATS):
+    """Best-of-`repeats` process CPU time per call, in microseconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.process_time()
+        for _ in range(iterations):
+            func(*args)
+        best = min(best, time.process_time() - started)
+    return best / iterations * 1e6
+
+
+def run(iterations=ITERATIONS, repeats=REPEATS):
+    """Time the codec alone and a full in-process get_time call, for each backend."""
+    import simple_server  # deferred: importing the server sets up its module state
+
+    token = simple_server.issue_token()
+    body = json.dumps({'jsonrpc': '2.0', 'method': 'get_time', 'token': token, 'id': 1}).encode('utf-8')
+    response = simple_server.handle_rpc_payload(body)[1]
+    rows = [('codec', 'legacy json', cpu_per_call(legacy_roundtrip, (body, response), iterations, repeats))]
+    previous = rpc_codec.backend
+    try:
+        for name in reversed(rpc_codec.BACKENDS):
+            rpc_codec.set_backend(name)
+            rows.append(('codec', name, cpu_per_call(codec_roundtrip, (body, response), iterations, repeats)))
+        for name in reversed(rpc_codec.BACKENDS):
+            rpc_codec.set_backend(name)
+            rows.append(('get_time', name, cpu_per_call(simple_server.handle_http_request, ('POST', '/', body),
+                                                        iterations, repeats)))
+    finally:
+        rpc_codec.set_backend(previous)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CPU per get_time request for each JSON codec path')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    args = parser.parse_args()
+    results = run(args.iterations, args.repeats)
+    print(f"{'path':<10}{'backend':<14}{'us/request':>12}")
+    for path, backend, micros in results:
+        print(f'{path:<10}{backend:<14}{micros:>12.2f}')
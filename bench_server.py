@@ -0,0 +1,274 @@
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Relative weights of the methods in the default workload
+DEFAULT_MIX = 'get_time=8,echo=4,purchase_token=1'
+DURATION_SECONDS = 10.0
+CONCURRENCY = 16
+# Ports used with --spawn
+SERVER_PORT = 8181
+FAKE_NODE_PORT = 9191
+# How long to wait for spawned processes and for the first token
+STARTUP_TIMEOUT_SECONDS = 30.0
+
+
+def parse_mix(text):
+    """'get_time=8,echo=4' -> [('get_time', 8.0), ('echo', 4.0)]"""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Client:
+    """One keep-alive connection issuing JSON-RPC calls."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self.conn = None
+        self._next_id = 0
+
+    def call(self, method, params=None, token=None):
+        """Return (http_status, response object or None)."""
+        self._next_id += 1
+        request = {'jsonrpc': '2.0', 'method': method, 'id': self._next_id}
+        if params is not None:
+            request['params'] = params
+        if token:
+            request['token'] = token
+        body = json.dumps(request).encode('utf-8')
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request('POST', self.path, body, {'Content-Type': 'application/json'})
+                response = self.conn.getresponse()
+                payload = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, json.loads(payload) if payload else None
+            except (ConnectionError, http.client.HTTPException, socket.timeout):
+                # The server closed an idle keep-alive connection; reconnect once
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def obtain_token(url, timeout=STARTUP_TIMEOUT_SECONDS):
+    """Call purchase_token until a payment is available and return the token."""
+    client = Client(url)
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            status, response = client.call('purchase_token')
+            if status == 200:
+                return response['result']
+            time.sleep(0.5)
+    finally:
+        client.close()
+    raise RuntimeError(f'No token within {timeout:.0f}s; is a payment stream running?')
+
+
+class Recorder:
+    """Per-worker latency samples and status counts, merged after the run."""
+
+    def __init__(self):
+        self.latencies = {}   # method -> [seconds]
+        self.statuses = {}    # (method, status) -> count
+        self.errors = 0
+
+    def merge(self, other):
+        for method, samples in other.latencies.items():
+            self.latencies.setdefault(method, []).extend(samples)
+        for key, count in other.statuses.items():
+            self.statuses[key] = self.statuses.get(key, 0) + count
+        self.errors += other.errors
+
+
+def worker(url, mix, token, deadline, recorder, seed):
+    rng = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    client = Client(url)
+    try:
+        while time.monotonic() < deadline:
+            method = rng.choices(names, weights)[0]
+            params = {'message': 'bench'} if method == 'echo' else None
+            started = time.perf_counter()
+            try:
+                status, _ = client.call(method, params, None if method == 'purchase_token' else token)
+            except (OSError, http.client.HTTPException, ValueError):
+                recorder.errors += 1
+                continue
+            recorder.latencies.setdefault(method, []).append(time.perf_counter() - started)
+            recorder.statuses[(method, status)] = recorder.statuses.get((method, status), 0) + 1
+    finally:
+        client.close()
+
+
+def run(url, mix, duration=DURATION_SECONDS, concurrency=CONCURRENCY, token=None):
+    """Drive the server with `concurrency` keep-alive clients and return a report dict."""
+    if token is None and any(name != 'purchase_token' for name, _ in mix):
+        token = obtain_token(url)
+    recorders = [Recorder() for _ in range(concurrency)]
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [threading.Thread(target=worker, args=(url, mix, token, deadline, recorders[i], i))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    total = Recorder()
+    for recorder in recorders:
+        total.merge(recorder)
+    report = {'duration_s': round(elapsed, 3), 'concurrency': concurrency, 'errors': total.errors, 'methods': {}}
+    all_samples = []
+    for method, samples in sorted(total.latencies.items()):
+        samples.sort()
+        all_samples.extend(samples)
+        report['methods'][method] = _summary(samples, elapsed)
+        report['methods'][method]['statuses'] = {
+            str(status): count for (name, status), count in sorted(total.statuses.items()) if name == method
+        }
+    all_samples.sort()
+    report['total'] = _summary(all_samples, elapsed)
+    return report
+
+
+def _summary(samples, elapsed):
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'p999_ms': round(percentile(samples, 0.999) * 1000, 3),
+    }
+
+
+def print_report(report):
+    print(f"{report['concurrency']} clients, {report['duration_s']}s, {report['errors']} connection errors")
+    print(f"{'method':<16}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'p999 ms':>10}  statuses")
+    rows = list(report['methods'].items()) + [('total', report['total'])]
+    for method, row in rows:
+        statuses = ' '.join(f'{status}:{count}' for status, count in row.get('statuses', {}).items())
+        print(f"{method:<16}{row['requests']:>10}{row['rps']:>10}{row['p50_ms']:>10}"
+              f"{row['p99_ms']:>10}{row['p999_ms']:>10}  {statuses}")
+
+
+def _wait_for_port(port, timeout=STARTUP_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Nothing listening on port {port} after {timeout:.0f}s')
+
+
+def _server_env(mode):
+    env = dict(os.environ)
+    if mode == 'prefork':
+        env['MCP_TOKEN_STORE_BACKEND'] = 'sqlite'
+        env['MCP_TOKEN_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-server-'), 'state.db')
+    return env
+
+
+def spawn_stack(mode, workers=None, node_args=()):
+    """Start fake_sui_node.py and simple_server.py pointed at it; returns (url, processes).
+
+    The server runs without rate limiting, since every benchmark client shares one address.
+    In prefork mode its workers share a SQLite store in a fresh temporary directory.
+    """
+    node = subprocess.Popen([sys.executable, os.path.join(HERE, 'fake_sui_node.py'),
+                             '--port', str(FAKE_NODE_PORT), *node_args])
+    processes = [node]
+    try:
+        _wait_for_port(FAKE_NODE_PORT)
+        command = [sys.executable, os.path.join(HERE, 'simple_server.py'), '--mode', mode,
+                   '--port', str(SERVER_PORT), '--log-level', 'WARNING', '--no-rate-limit',
+                   '--sui-rpc-url', f'http://127.0.0.1:{FAKE_NODE_PORT}']
+        if workers:
+            command += ['--workers', str(workers)]
+        processes.append(subprocess.Popen(command, env=_server_env(mode)))
+        _wait_for_port(SERVER_PORT)
+    except Exception:
+        stop_stack(processes)
+        raise
+    return f'http://127.0.0.1:{SERVER_PORT}/', processes
+
+
+def stop_stack(processes):
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test simple_server.py and report latency percentiles')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{SERVER_PORT}/', help='server to drive (ignored with --spawn)')
+    parser.add_argument('--spawn', action='store_true',
+                        help='start fake_sui_node.py and simple_server.py locally for the run')
+    parser.add_argument('--mode', default='threaded', help='server --mode with --spawn')
+    parser.add_argument('--workers', type=int, default=None, help='server --workers with --spawn')
+    parser.add_argument('--node-latency-ms', type=float, default=0.0, help='fake fullnode latency with --spawn')
+    parser.add_argument('--node-error-rate', type=float, default=0.0, help='fake fullnode 503 rate with --spawn')
+    parser.add_argument('--payment-rate', type=float, default=5.0, help='fake payments per second with --spawn')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='method weights (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=DURATION_SECONDS)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--token', default=None, help='JWT for authenticated methods (default: buy one)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    processes = []
+    url = args.url
+    if args.spawn:
+        node_args = ['--latency-ms', str(args.node_latency_ms), '--error-rate', str(args.node_error_rate),
+                     '--payment-rate', str(args.payment_rate)]
+        url, processes = spawn_stack(args.mode, args.workers, node_args)
+    try:
+        result = run(url, parse_mix(args.mix), args.duration, args.concurrency, args.token)
+    finally:
+        stop_stack(processes)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
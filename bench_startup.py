@@ -0,0 +1,127 @@
+import argparse
+import http.client
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs per measurement (the median is reported)
+RUNS = 5
+# Port used by the spawned servers
+SERVER_PORT = 8183
+# An address nothing listens on: the server must start without reaching a fullnode
+UNREACHABLE_RPC_URL = 'http://127.0.0.1:9'
+STARTUP_TIMEOUT_SECONDS = 30.0
+POLL_INTERVAL_SECONDS = 0.002
+
+
+def _env(mode=None):
+    env = dict(os.environ)
+    env.setdefault('MCP_SECRET_KEY', 'bench-startup-secret-key-0123456789')
+    if mode == 'prefork':  # prefork workers share a SQLite store
+        env['MCP_TOKEN_STORE_BACKEND'] = 'sqlite'
+        env['MCP_TOKEN_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-startup-'), 'state.db')
+    return env
+
+
+def import_seconds(statement):
+    """Wall time of a fresh interpreter running `statement`, interpreter startup included."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', statement], cwd=HERE, env=_env(), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def _serving(port):
+    """True once GET /metrics on `port` answers 200."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+    try:
+        conn.request('GET', '/metrics')
+        return conn.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def _wait_serving(port, started, timeout=STARTUP_TIMEOUT_SECONDS):
+    while not _serving(port):
+        if time.perf_counter() - started > timeout:
+            raise RuntimeError(f'Server on port {port} not serving after {timeout:.0f}s')
+        time.sleep(POLL_INTERVAL_SECONDS)
+    return time.perf_counter() - started
+
+
+def _worker_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def serve_seconds(mode, port=SERVER_PORT, respawn=False):
+    """Seconds from launching simple_server.py until it answers, and (prefork, respawn=True)
+    from killing its only worker until the replacement answers."""
+    command = [sys.executable, os.path.join(HERE, 'simple_server.py'), '--mode', mode, '--port', str(port),
+               '--log-level', 'ERROR', '--sui-rpc-url', UNREACHABLE_RPC_URL]
+    if mode == 'prefork':
+        command += ['--workers', '1']
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=HERE, env=_env(mode), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = _wait_serving(port, started)
+        respawned = None
+        if respawn:
+            worker, = _worker_pids(process.pid)
+            killed = time.perf_counter()
+            os.kill(worker, signal.SIGKILL)
+            while _serving(port):  # until the dead worker's socket is gone
+                time.sleep(POLL_INTERVAL_SECONDS)
+            respawned = _wait_serving(port, killed)
+        return ready, respawned
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def run(runs=RUNS, modes=('threaded', 'asyncio', 'prefork')):
+    """Median startup times in milliseconds."""
+    def median_ms(samples):
+        return round(statistics.median(samples) * 1000, 1)
+
+    report = {
+        'python_startup_ms': median_ms([import_seconds('pass') for _ in range(runs)]),
+        'import_simple_server_ms': median_ms([import_seconds('import simple_server') for _ in range(runs)]),
+        'import_with_pysui_ms': median_ms([import_seconds('import simple_server, sui_access; sui_access.load_pysui()')
+                                           for _ in range(runs)]),
+        'time_to_serve_ms': {},
+    }
+    for mode in modes:
+        samples = [serve_seconds(mode, respawn=(mode == 'prefork' and os.path.exists('/proc/self/task')))
+                   for _ in range(runs)]
+        report['time_to_serve_ms'][mode] = median_ms([ready for ready, _ in samples])
+        if samples[0][1] is not None:
+            report['prefork_respawn_ms'] = median_ms([respawned for _, respawned in samples])
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure simple_server.py import, startup and worker respawn times')
+    parser.add_argument('--runs', type=int, default=RUNS)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    result = run(args.runs)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"python startup            {result['python_startup_ms']:>8} ms")
+        print(f"import simple_server      {result['import_simple_server_ms']:>8} ms")
+        print(f"  ... plus pysui          {result['import_with_pysui_ms']:>8} ms")
+        for mode, ms in result['time_to_serve_ms'].items():
+            print(f"serving ({mode:<8})       {ms:>8} ms")
+        if 'prefork_respawn_ms' in result:
+            print(f"prefork worker respawn    {result['prefork_respawn_ms']:>8} ms")
@@ -0,0 +1,292 @@
+import argparse
+import hashlib
+import http.server
+import json
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PORT = 9000
+HOST = '127.0.0.1'
+# Reported by rpc.discover; pysui refuses nodes older than 1.41.0
+RPC_VERSION = '1.47.0'
+SUI_COIN_TYPE = '0x2::sui::SUI'
+# Synthetic payments per second credited to whichever address is queried
+PAYMENT_RATE = 1.0
+# Payments that already exist when the node starts (seen by the indexer's backfill)
+BACKFILL_PAYMENTS = 20
+PAYMENT_AMOUNT_MIST = 1_000_000_000
+GAS_MIST = 2_000_000
+
+
+def _schema_param(name, schema, required=False):
+    return {'name': name, 'required': required, 'schema': schema}
+
+
+# Just enough of the OpenRPC document for pysui to build and validate the builders it is used with
+DISCOVER_RESULT = {
+    'openrpc': '1.2.6',
+    'info': {'title': 'Fake Sui JSON-RPC', 'version': RPC_VERSION},
+    'methods': [
+        {
+            'name': 'suix_queryTransactionBlocks',
+            'params': [
+                _schema_param('query', {'type': 'object'}, required=True),
+                _schema_param('cursor', {'type': 'string'}),
+                _schema_param('limit', {'type': 'integer', 'format': 'uint', 'minimum': 0.0}),
+                _schema_param('descending_order', {'type': 'boolean'}),
+            ],
+            'result': {'name': 'TransactionBlocksPage', 'schema': {'type': 'object'}},
+        },
+        {
+            'name': 'sui_multiGetTransactionBlocks',
+            'params': [
+                _schema_param('digests', {'type': 'array', 'items': {'type': 'string'}}, required=True),
+                _schema_param('options', {'type': 'object'}),
+            ],
+            'result': {'name': 'SuiTransactionBlockResponses', 'schema': {'type': 'array', 'items': {'type': 'object'}}},
+        },
+        {
+            'name': 'suix_getReferenceGasPrice',
+            'params': [],
+            'result': {'name': 'ReferenceGasPrice', 'schema': {'type': 'string'}},
+        },
+    ],
+    'components': {'schemas': {}},
+}
+
+PROTOCOL_CONFIG_RESULT = {
+    'maxSupportedProtocolVersion': '80',
+    'minSupportedProtocolVersion': '1',
+    'protocolVersion': '80',
+    'featureFlags': {},
+    'attributes': {
+        'max_arguments': {'u32': '512'},
+        'max_input_objects': {'u64': '2048'},
+        'max_num_transferred_move_object_ids': {'u64': '2048'},
+        'max_programmable_tx_commands': {'u32': '1024'},
+        'max_pure_argument_size': {'u32': '16384'},
+        'max_tx_size_bytes': {'u64': '131072'},
+        'max_type_argument_depth': {'u32': '16'},
+        'max_type_arguments': {'u32': '16'},
+        'max_tx_gas': {'u64': '50000000000'},
+    },
+}
+
+
+class PaymentStream:
+    """Synthetic SUI transfers, materialised lazily as the clock passes each arrival time.
+
+    Arrivals are Poisson with `rate` per second; payments can also be added on
+    demand with add(). Every payment is credited to the address being queried.
+    """
+
+    def __init__(self, rate=PAYMENT_RATE, backfill=BACKFILL_PAYMENTS, amount=PAYMENT_AMOUNT_MIST, seed=None):
+        self.rate = rate
+        self.amount = amount
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._txs = []         # (timestamp_ms, digest, sender, amount), oldest first
+        self._positions = {}   # digest -> index in _txs
+        now_ms = int(time.time() * 1000)
+        for i in range(backfill):
+            self._append(now_ms - (backfill - i) * 1000)
+        self._next_ms = now_ms + self._gap_ms()
+
+    def _gap_ms(self):
+        if self.rate <= 0:
+            return float('inf')
+        return max(1, int(self._random.expovariate(self.rate) * 1000))
+
+    def _append(self, timestamp_ms, sender=None, amount=None):
+        seq = len(self._txs)
+        digest = hashlib.sha256(f'{id(self)}:{seq}'.encode()).hexdigest()[:44]
+        sender = sender or '0x' + hashlib.sha256(f'sender:{seq % 97}'.encode()).hexdigest()
+        self._positions[digest] = seq
+        self._txs.append((timestamp_ms, digest, sender, amount or self.amount))
+        return digest
+
+    def _advance(self):
+        now_ms = int(time.time() * 1000)
+        while self._next_ms <= now_ms:
+            self._append(self._next_ms)
+            self._next_ms += self._gap_ms()
+
+    def add(self, sender=None, amount=None):
+        """Record a payment landing now; returns its digest."""
+        with self._lock:
+            self._advance()
+            return self._append(int(time.time() * 1000), sender, amount)
+
+    def page(self, cursor, limit, descending):
+        """Return (digests, has_next_page) after `cursor`, in the requested order."""
+        with self._lock:
+            self._advance()
+            digests = [tx[1] for tx in self._txs]
+            position = self._positions.get(cursor) if cursor else None
+        if descending:
+            end = position if position is not None else len(digests)
+            page = digests[max(0, end - limit):end][::-1]
+            return page, end - limit > 0
+        start = position + 1 if position is not None else 0
+        page = digests[start:start + limit]
+        return page, start + limit < len(digests)
+
+    def get(self, digest):
+        with self._lock:
+            position = self._positions.get(digest)
+            return None if position is None else self._txs[position]
+
+
+class FakeSuiNode:
+    """JSON-RPC logic of the fake fullnode, independent of the HTTP transport.
+
+    `latency_ms` (+ uniform `jitter_ms`) is added to every call. With
+    probability `error_rate` a call fails with HTTP 503 and a non-JSON body,
+    which pysui reports as a transport error, and with `rpc_error_rate` it
+    gets a JSON-RPC internal error instead. Payments are credited to
+    `recipient`, or to the last address queried with a ToAddress filter.
+    """
+
+    def __init__(self, stream=None, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rpc_error_rate=0.0,
+                 recipient=None):
+        self.stream = stream or PaymentStream()
+        self.recipient = recipient
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rpc_error_rate = rpc_error_rate
+        self.calls = {}
+        self._methods = {
+            'rpc.discover': lambda params: DISCOVER_RESULT,
+            'suix_getReferenceGasPrice': lambda params: '1000',
+            'sui_getProtocolConfig': lambda params: PROTOCOL_CONFIG_RESULT,
+            'suix_queryTransactionBlocks': self._query_transaction_blocks,
+            'sui_multiGetTransactionBlocks': self._multi_get_transaction_blocks,
+            'fake_addPayment': self._add_payment,
+        }
+
+    def handle(self, request):
+        """Return (http_status, response object or None for a garbled body)."""
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        method = request.get('method') if isinstance(request, dict) else None
+        self.calls[method] = self.calls.get(method, 0) + 1
+        rpc_id = request.get('id') if isinstance(request, dict) else None
+        if method != 'fake_addPayment':
+            if random.random() < self.error_rate:
+                return 503, None
+            if random.random() < self.rpc_error_rate:
+                return 200, _error(-32603, 'Injected internal error', rpc_id)
+        handler = self._methods.get(method)
+        if handler is None:
+            return 200, _error(-32601, f'Method not found: {method}', rpc_id)
+        try:
+            result = handler(request.get('params') or [])
+        except (TypeError, ValueError, KeyError, IndexError) as e:
+            return 200, _error(-32602, f'Invalid params: {e}', rpc_id)
+        return 200, {'jsonrpc': '2.0', 'result': result, 'id': rpc_id}
+
+    def _query_transaction_blocks(self, params):
+        query, cursor, limit, descending = (list(params) + [None] * 4)[:4]
+        address = ((query or {}).get('filter') or {}).get('ToAddress')
+        if address:
+            self.recipient = address
+        digests, has_next = self.stream.page(cursor, int(limit or 50), bool(descending))
+        return {
+            'data': [{'digest': digest} for digest in digests],
+            'nextCursor': digests[-1] if digests else cursor,
+            'hasNextPage': has_next,
+        }
+
+    def _multi_get_transaction_blocks(self, params):
+        digests = params[0]
+        blocks = []
+        for digest in digests:
+            tx = self.stream.get(digest)
+            if tx is None:
+                continue
+            timestamp_ms, digest, sender, amount = tx
+            blocks.append({
+                'digest': digest,
+                'timestampMs': str(timestamp_ms),
+                'checkpoint': str(timestamp_ms // 250),
+                'balanceChanges': [
+                    {'owner': {'AddressOwner': sender}, 'coinType': SUI_COIN_TYPE, 'amount': str(-(amount + GAS_MIST))},
+                    {'owner': {'AddressOwner': self.recipient}, 'coinType': SUI_COIN_TYPE, 'amount': str(amount)},
+                ],
+            })
+        return blocks
+
+    def _add_payment(self, params):
+        sender, amount = (list(params) + [None, None])[:2]
+        return self.stream.add(sender, amount)
+
+
+def _error(code, message, rpc_id):
+    return {'jsonrpc': '2.0', 'error': {'code': code, 'message': message}, 'id': rpc_id}
+
+
+class FakeSuiNodeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    node = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self._send(200, _error(-32700, 'Parse error', None))
+            return
+        self._send(*self.node.handle(request))
+
+    def _send(self, status, response):
+        payload = b'Service Unavailable' if response is None else json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain' if response is None else 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        log.debug('%s - ' + format, self.address_string(), *args)
+
+
+def start_fake_node(node, host=HOST, port=0):
+    """Serve `node` from a daemon thread; returns the server (its URL is http://host:server.server_port)."""
+    handler = type('BoundFakeSuiNodeHandler', (FakeSuiNodeHandler,), {'node': node})
+    httpd = http.server.ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name='fake-sui-node', daemon=True).start()
+    return httpd
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline stand-in for a Sui JSON-RPC fullnode')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every call')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='uniform extra latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls failing with HTTP 503')
+    parser.add_argument('--rpc-error-rate', type=float, default=0.0, help='share of calls getting a JSON-RPC error')
+    parser.add_argument('--payment-rate', type=float, default=PAYMENT_RATE, help='synthetic payments per second')
+    parser.add_argument('--backfill', type=int, default=BACKFILL_PAYMENTS, help='payments present at startup')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    fake_node = FakeSuiNode(
+        PaymentStream(rate=args.payment_rate, backfill=args.backfill, seed=args.seed),
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rpc_error_rate=args.rpc_error_rate
+    )
+    server = start_fake_node(fake_node, args.host, args.port)
+    log.info('Fake Sui fullnode on http://%s:%s', args.host, server.server_port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,175 @@
+import bisect
+import threading
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Fold the shards of finished threads into the totals every this many new shards
+_SWEEP_EVERY = 64
+
+
+class _Shard:
+    """Counters and histograms written by exactly one thread, so updates need no lock."""
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}     # (name, labels) -> number
+        self.histograms = {}   # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+
+class MetricsRegistry:
+    """Prometheus-style counters, gauges and histograms with per-thread shards.
+
+    inc() and observe() only touch the calling thread's shard, so recording is
+    a couple of dict operations with no lock. render() merges all shards (and
+    the totals left by threads that have exited) into the text exposition
+    format. Gauges, and counters kept by another component, are callables
+    evaluated at scrape time.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._created = 0
+        self._help = {}
+        self._types = {}
+        self._callbacks = {}  # name -> callable returning a number or {labels: number}
+
+    def describe(self, name, kind, help_text):
+        self._types[name] = kind
+        self._help[name] = help_text
+
+    def gauge(self, name, help_text, func):
+        """Register a gauge computed by `func()` at scrape time."""
+        self.describe(name, 'gauge', help_text)
+        self._callbacks[name] = func
+
+    def counter(self, name, help_text, func):
+        """Register a counter whose running total `func()` reads from its owner at scrape time."""
+        self.describe(name, 'counter', help_text)
+        self._callbacks[name] = func
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        buckets = histograms.get(key)
+        if buckets is None:
+            buckets = histograms[key] = [0] * (len(self.buckets) + 2)
+        buckets[bisect.bisect_left(self.buckets, value)] += 1
+        buckets[-1] += value
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+                self._created += 1
+                if self._created % _SWEEP_EVERY == 0:
+                    self._retire_dead_shards()
+        return shard
+
+    def _retire_dead_shards(self):
+        # Caller holds self._lock. Threads that exited never write again, so their
+        # values can be folded into the totals and the shard dropped.
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._merge_into(self._retired, shard)
+        self._shards = alive
+
+    @staticmethod
+    def _merge_into(target, shard):
+        for key, value in shard.counters.copy().items():
+            target.counters[key] = target.counters.get(key, 0) + value
+        for key, values in shard.histograms.copy().items():
+            merged = target.histograms.get(key)
+            if merged is None:
+                target.histograms[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    merged[i] += value
+
+    def snapshot(self):
+        """Merged view of every shard: a _Shard that belongs to no thread."""
+        total = _Shard(None)
+        with self._lock:
+            self._retire_dead_shards()
+            self._merge_into(total, self._retired)
+            for shard in self._shards:
+                self._merge_into(total, shard)
+        return total
+
+    def counter_value(self, name, labels=()):
+        return self.snapshot().counters.get((name, labels), 0)
+
+    def render(self):
+        """Return the Prometheus text exposition of every metric."""
+        total = self.snapshot()
+        families = {}
+        for (name, labels), value in total.counters.items():
+            families.setdefault(name, []).append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for (name, labels), values in total.histograms.items():
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                le = bound if isinstance(bound, str) else repr(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(values[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        for name, func in self._callbacks.items():
+            try:
+                value = func()
+            except Exception:
+                continue
+            if isinstance(value, dict):
+                families[name] = [f'{name}{_format_labels(labels)} {_format_value(v)}' for labels, v in value.items()]
+            else:
+                families[name] = [f'{name} {_format_value(value)}']
+
+        out = []
+        for name in sorted(families):
+            if name in self._help:
+                out.append(f'# HELP {name} {self._help[name]}')
+                out.append(f'# TYPE {name} {self._types[name]}')
+            out.extend(families[name])
+        return '\n'.join(out) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Process-wide registry used by the server and its background services
+METRICS = MetricsRegistry()
+METRICS.describe('rpc_requests_total', 'counter', 'JSON-RPC calls by method and HTTP status.')
+METRICS.describe('rpc_request_duration_seconds', 'histogram', 'JSON-RPC call latency by method and HTTP status.')
+METRICS.describe('http_requests_total', 'counter', 'HTTP requests by command and status.')
+METRICS.describe('http_request_duration_seconds', 'histogram', 'HTTP request latency by command and status.')
+METRICS.describe('http_requests_started_total', 'counter', 'HTTP requests that have started processing.')
+METRICS.describe('sui_rpc_requests_total', 'counter', 'Sui fullnode calls by phase and outcome.')
+METRICS.describe('sui_rpc_duration_seconds', 'histogram', 'Sui fullnode call latency by phase.')
+METRICS.describe('rate_limited_total', 'counter', 'Requests refused by rate limiting, by scope (ip or method).')
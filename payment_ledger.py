@@ -0,0 +1,281 @@
+import threading
+import time
+from collections import deque
+from token_store import SQLiteConnections
+
+# Payments (claimed or not) older than this are forgotten; must exceed any claim window
+RETENTION_MS = 60 * 60 * 1000
+
+
+class Payment:
+    __slots__ = ('digest', 'timestamp_ms', 'sender', 'amount', 'consumed')
+
+    def __init__(self, digest, timestamp_ms, sender=None, amount=None, consumed=False):
+        self.digest = digest
+        self.timestamp_ms = timestamp_ms
+        self.sender = sender
+        self.amount = amount
+        self.consumed = consumed
+
+
+class PaymentLedger:
+    """Indexed ledger of incoming payments and which of them have been consumed.
+
+    Every payment can back exactly one claim. Unconsumed payments are queued in
+    arrival order, globally and per sender, so claim() pops the oldest eligible
+    payment in amortised O(1); claiming a specific digest is a dict lookup. All
+    mutations happen under one lock, so concurrent purchase_token calls can never
+    claim the same payment twice. Entries older than RETENTION_MS are expired by
+    prune(), and record() refuses payments that old so they cannot come back.
+    """
+
+    # Consumption is forgotten when the process exits, and is not seen by other processes
+    persistent = False
+
+    def __init__(self, retention_ms=RETENTION_MS):
+        self.retention_ms = retention_ms
+        self._synced_ms = None
+        self._initialized = False
+        self._lock = threading.Lock()
+        self._payments = {}          # digest -> Payment
+        self._order = deque()        # every Payment, oldest first, for expiry
+        self._unconsumed = deque()   # claim queue (may hold stale consumed entries)
+        self._by_sender = {}         # sender -> deque of Payment
+
+    def __len__(self):
+        return len(self._payments)
+
+    def __contains__(self, digest):
+        return digest in self._payments
+
+    def record(self, digest, timestamp_ms, sender=None, amount=None, consumed=False):
+        """Add a payment seen on chain. Returns False if it is known or already expired."""
+        with self._lock:
+            if digest in self._payments or timestamp_ms < self._horizon():
+                return False
+            payment = Payment(digest, timestamp_ms, sender, amount, consumed)
+            self._payments[digest] = payment
+            self._order.append(payment)
+            if not consumed:
+                self._unconsumed.append(payment)
+                if sender:
+                    self._by_sender.setdefault(sender, deque()).append(payment)
+            return True
+
+    def claim(self, since_ms, digest=None, sender=None, min_amount=None):
+        """Atomically consume one payment with timestamp_ms >= since_ms.
+
+        With `digest`, only that payment is considered; with `sender`, only
+        payments from that address. Returns the Payment, or None if nothing
+        eligible is available.
+        """
+        with self._lock:
+            if digest is not None:
+                payment = self._payments.get(digest)
+                if payment is None or not self._eligible(payment, since_ms, sender, min_amount):
+                    return None
+                payment.consumed = True
+                return payment
+
+            queue = self._unconsumed if sender is None else self._by_sender.get(sender)
+            if not queue:
+                return None
+            skipped = []
+            claimed = None
+            while queue:
+                payment = queue.popleft()
+                if payment.consumed:
+                    continue
+                if payment.timestamp_ms < since_ms:
+                    # The claim window only moves forward, so this payment is out of the
+                    # queue for good; it can still be claimed by digest until it expires
+                    continue
+                if min_amount is not None and (payment.amount or 0) < min_amount:
+                    skipped.append(payment)
+                    continue
+                claimed = payment
+                break
+            queue.extendleft(reversed(skipped))
+            if sender is not None and not queue:
+                del self._by_sender[sender]
+            if claimed is not None:
+                claimed.consumed = True
+            return claimed
+
+    def prune(self, now_ms=None):
+        """Expire entries older than the retention window. Returns how many were removed."""
+        horizon = self._horizon(now_ms)
+        removed = 0
+        with self._lock:
+            while self._order and self._order[0].timestamp_ms < horizon:
+                payment = self._order.popleft()
+                self._payments.pop(payment.digest, None)
+                payment.consumed = True  # lets the claim queues drop it lazily
+                removed += 1
+                if payment.sender in self._by_sender:
+                    self._drop_consumed(self._by_sender[payment.sender])
+                    if not self._by_sender[payment.sender]:
+                        del self._by_sender[payment.sender]
+            self._drop_consumed(self._unconsumed)
+        return removed
+
+    @staticmethod
+    def _drop_consumed(queue):
+        while queue and queue[0].consumed:
+            queue.popleft()
+
+    def _eligible(self, payment, since_ms, sender, min_amount):
+        if payment.consumed or payment.timestamp_ms < since_ms:
+            return False
+        if sender is not None and payment.sender != sender:
+            return False
+        if min_amount is not None and (payment.amount or 0) < min_amount:
+            return False
+        return True
+
+    def mark_synced(self, now_ms=None):
+        """Record that the payment indexer has just caught up with the chain."""
+        self._synced_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+
+    def synced_ms(self):
+        """Epoch ms of the indexer's last completed sync, or None if there was none yet."""
+        return self._synced_ms
+
+    def reset_synced(self):
+        self._synced_ms = None
+
+    def initialized(self):
+        """True once a first sync has been recorded; until then, backfilled payments are
+        recorded as consumed, since they may have been redeemed against an earlier ledger."""
+        return self._initialized
+
+    def mark_initialized(self):
+        self._initialized = True
+
+    def _horizon(self, now_ms=None):
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        return now_ms - self.retention_ms
+
+
+class SQLitePaymentLedger:
+    """PaymentLedger kept in a SQLite file, shared by every process on the host.
+
+    Same interface as PaymentLedger. A claim picks a candidate and then
+    consumes it with `UPDATE ... WHERE digest = ? AND consumed = 0`, so of
+    several processes racing for one payment exactly one wins; the others move
+    on to the next candidate. Consumption survives restarts, so once the ledger
+    is initialized, payments found again by the indexer's startup backfill can
+    be recorded as unconsumed; a new (or deleted) file is not initialized, so its
+    first backfill is recorded as consumed. The time of the indexer's last sync
+    is stored too, so every worker can tell whether the (single, per-host)
+    indexer is keeping up.
+    """
+
+    persistent = True
+
+    def __init__(self, path, retention_ms=RETENTION_MS):
+        self.path = path
+        self.retention_ms = retention_ms
+        self._connections = SQLiteConnections(path)
+        conn = self._connections.get()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS payments ('
+            ' digest TEXT PRIMARY KEY,'
+            ' timestamp_ms INTEGER NOT NULL,'
+            ' sender TEXT,'
+            ' amount INTEGER,'
+            ' consumed INTEGER NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS payments_unconsumed ON payments (consumed, timestamp_ms)')
+        conn.execute('CREATE INDEX IF NOT EXISTS payments_sender ON payments (sender, consumed, timestamp_ms)')
+        conn.execute('CREATE TABLE IF NOT EXISTS payment_ledger_state (key TEXT PRIMARY KEY, value INTEGER)')
+
+    def __len__(self):
+        return self._connections.get().execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+
+    def __contains__(self, digest):
+        return self._connections.get().execute('SELECT 1 FROM payments WHERE digest = ?', (digest,)).fetchone() is not None
+
+    def record(self, digest, timestamp_ms, sender=None, amount=None, consumed=False):
+        """Add a payment seen on chain. Returns False if it is known or already expired."""
+        if timestamp_ms < self._horizon():
+            return False
+        cursor = self._connections.get().execute(
+            'INSERT OR IGNORE INTO payments (digest, timestamp_ms, sender, amount, consumed) VALUES (?, ?, ?, ?, ?)',
+            (digest, timestamp_ms, sender, amount, int(consumed))
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, since_ms, digest=None, sender=None, min_amount=None):
+        """Atomically consume one payment with timestamp_ms >= since_ms (see PaymentLedger.claim)."""
+        conditions = ['consumed = 0', 'timestamp_ms >= ?']
+        params = [since_ms]
+        if digest is not None:
+            conditions.append('digest = ?')
+            params.append(digest)
+        if sender is not None:
+            conditions.append('sender = ?')
+            params.append(sender)
+        if min_amount is not None:
+            conditions.append('COALESCE(amount, 0) >= ?')
+            params.append(min_amount)
+        select = ('SELECT digest, timestamp_ms, sender, amount FROM payments WHERE '
+                  + ' AND '.join(conditions) + ' ORDER BY timestamp_ms LIMIT 1')
+        conn = self._connections.get()
+        while True:
+            row = conn.execute(select, params).fetchone()
+            if row is None:
+                return None
+            if conn.execute('UPDATE payments SET consumed = 1 WHERE digest = ? AND consumed = 0',
+                            (row[0],)).rowcount == 1:
+                return Payment(*row, consumed=True)
+            # Another thread or process consumed it between the two statements; try the next one
+
+    def prune(self, now_ms=None):
+        """Expire entries older than the retention window. Returns how many were removed."""
+        return self._connections.get().execute(
+            'DELETE FROM payments WHERE timestamp_ms < ?', (self._horizon(now_ms),)).rowcount
+
+    def mark_synced(self, now_ms=None):
+        """Record that the payment indexer has just caught up with the chain."""
+        self._connections.get().execute(
+            "INSERT OR REPLACE INTO payment_ledger_state (key, value) VALUES ('synced_ms', ?)",
+            (now_ms if now_ms is not None else int(time.time() * 1000),)
+        )
+
+    def synced_ms(self):
+        """Epoch ms of the indexer's last completed sync, or None if there was none yet."""
+        row = self._connections.get().execute(
+            "SELECT value FROM payment_ledger_state WHERE key = 'synced_ms'").fetchone()
+        return None if row is None else row[0]
+
+    def reset_synced(self):
+        self._connections.get().execute("DELETE FROM payment_ledger_state WHERE key = 'synced_ms'")
+
+    def initialized(self):
+        """True once a first sync has been recorded in this file (see PaymentLedger.initialized)."""
+        return self._connections.get().execute(
+            "SELECT 1 FROM payment_ledger_state WHERE key = 'initialized'").fetchone() is not None
+
+    def mark_initialized(self):
+        self._connections.get().execute(
+            "INSERT OR IGNORE INTO payment_ledger_state (key, value) VALUES ('initialized', 1)")
+
+    def close(self):
+        self._connections.close()
+
+    def _horizon(self, now_ms=None):
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        return now_ms - self.retention_ms
+
+
+def open_payment_ledger(backend, path=None):
+    """Build the payment ledger for a token store backend: in memory, or a table next to the SQLite tokens."""
+    if backend == 'memory':
+        return PaymentLedger()
+    if backend == 'sqlite':
+        return SQLitePaymentLedger(path)
+    raise ValueError(f"Unknown payment ledger backend: {backend}")
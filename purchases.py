@@ -0,0 +1,276 @@
+import asyncio
+import heapq
+import json
+import secrets
+import threading
+import time
+from collections import deque
+
+# Pending purchases not matched to a payment within this window expire
+PENDING_TTL_SECONDS = 15 * 60
+# Completed purchases (and their tokens) stay retrievable this long
+RESULT_TTL_SECONDS = 5 * 60
+# Upper bound on purchases kept in memory
+MAX_PURCHASES = 100_000
+# Seconds between SSE keep-alive comments
+HEARTBEAT_SECONDS = 15.0
+
+PENDING = 'pending'
+COMPLETED = 'completed'
+EXPIRED = 'expired'
+
+
+class Purchase:
+    __slots__ = ('purchase_id', 'created_ms', 'expires_ms', 'sender', 'digest', 'status', 'token',
+                 'payment_digest', 'subscribers')
+
+    def __init__(self, purchase_id, created_ms, expires_ms, sender=None, digest=None):
+        self.purchase_id = purchase_id
+        self.created_ms = created_ms
+        self.expires_ms = expires_ms
+        self.sender = sender
+        self.digest = digest
+        self.status = PENDING
+        self.token = None
+        self.payment_digest = None
+        self.subscribers = None   # callables run once the purchase leaves PENDING
+
+    def as_dict(self):
+        result = {'purchase_id': self.purchase_id, 'status': self.status, 'expires_at': self.expires_ms // 1000}
+        if self.status == COMPLETED:
+            result['token'] = self.token
+            result['digest'] = self.payment_digest
+        return result
+
+
+class PurchaseBook:
+    """Purchases waiting for a payment, matched as the indexer records payments.
+
+    `claim(since_ms, digest, sender)` atomically consumes a payment (normally
+    PaymentLedger.claim with the server's window and minimum) and `issue()`
+    returns a new access token. create() claims an already indexed payment
+    straight away; otherwise the purchase is parked in one of three indexes
+    (by digest, by sender, or a FIFO of anonymous purchases) and offer(),
+    called for every newly seen payment, completes the oldest matching one in
+    amortised O(1). Waiters never poll: wait() blocks on an event and
+    wait_async() on a future, both woken by the matcher.
+    """
+
+    def __init__(self, claim, issue, window_ms, pending_ttl=PENDING_TTL_SECONDS, result_ttl=RESULT_TTL_SECONDS,
+                 max_purchases=MAX_PURCHASES):
+        self.claim = claim
+        self.issue = issue
+        self.window_ms = window_ms
+        self.pending_ttl_ms = int(pending_ttl * 1000)
+        self.result_ttl_ms = int(result_ttl * 1000)
+        self.max_purchases = max_purchases
+        self._lock = threading.Lock()
+        self._purchases = {}       # purchase_id -> Purchase
+        self._by_digest = {}       # digest -> Purchase
+        self._by_sender = {}       # sender -> deque of Purchase
+        self._anonymous = deque()  # Purchases without digest/sender, oldest first
+        self._expiry = []          # heap of (expires_ms, purchase_id)
+
+    def __len__(self):
+        return len(self._purchases)
+
+    def get(self, purchase_id):
+        self.expire()
+        return self._purchases.get(purchase_id)
+
+    def create(self, sender=None, digest=None):
+        """Start a purchase. Returns the Purchase, or None when the book is full."""
+        now_ms = int(time.time() * 1000)
+        self.expire(now_ms)
+        with self._lock:
+            if len(self._purchases) >= self.max_purchases:
+                return None
+            purchase = Purchase(secrets.token_urlsafe(16), now_ms, now_ms + self.pending_ttl_ms, sender, digest)
+            self._purchases[purchase.purchase_id] = purchase
+            heapq.heappush(self._expiry, (purchase.expires_ms, purchase.purchase_id))
+            # Under the book lock, so a payment recorded meanwhile is either claimed
+            # here or offered to this purchase once it is parked
+            payment = self.claim(now_ms - self.window_ms, digest, sender)
+            if payment is None:
+                self._park(purchase)
+            else:
+                self._complete(purchase, payment.digest)
+        if payment is not None:
+            self._notify(purchase)
+        return purchase
+
+    def offer(self, digest, timestamp_ms, sender=None):
+        """Match a newly recorded payment to the oldest eligible pending purchase."""
+        with self._lock:
+            purchase = self._match(digest, timestamp_ms, sender)
+            if purchase is None or self.claim(purchase.created_ms - self.window_ms, digest, None) is None:
+                return None
+            self._unpark(purchase)
+            self._complete(purchase, digest)
+        self._notify(purchase)
+        return purchase
+
+    def _match(self, digest, timestamp_ms, sender):
+        candidate = self._by_digest.get(digest)
+        if candidate is not None:
+            return candidate
+        queues = [self._by_sender.get(sender)] if sender else []
+        queues.append(self._anonymous)
+        for queue in queues:
+            while queue:
+                candidate = queue[0]
+                if candidate.status != PENDING:
+                    queue.popleft()
+                    continue
+                if timestamp_ms < candidate.created_ms - self.window_ms:
+                    # Payment too old for the oldest purchase in this queue, and so for all of them
+                    break
+                return candidate
+        return None
+
+    def _park(self, purchase):
+        if purchase.digest:
+            self._by_digest[purchase.digest] = purchase
+        elif purchase.sender:
+            self._by_sender.setdefault(purchase.sender, deque()).append(purchase)
+        else:
+            self._anonymous.append(purchase)
+
+    def _unpark(self, purchase):
+        if purchase.digest:
+            self._by_digest.pop(purchase.digest, None)
+        elif purchase.sender:
+            queue = self._by_sender.get(purchase.sender)
+            if queue and queue[0] is purchase:
+                queue.popleft()
+            if not queue:
+                self._by_sender.pop(purchase.sender, None)
+        elif self._anonymous and self._anonymous[0] is purchase:
+            self._anonymous.popleft()
+        # Anywhere else it is dropped lazily, being no longer PENDING
+
+    def _drop_expired(self, purchase):
+        # Pending TTLs are equal, so within a queue expired purchases sit at the head
+        if purchase.digest:
+            self._by_digest.pop(purchase.digest, None)
+            return
+        queue = self._by_sender.get(purchase.sender) if purchase.sender else self._anonymous
+        while queue and queue[0].status != PENDING:
+            queue.popleft()
+        if purchase.sender and not queue:
+            self._by_sender.pop(purchase.sender, None)
+
+    def _complete(self, purchase, payment_digest):
+        # Caller holds self._lock and has consumed the payment
+        purchase.token = self.issue()
+        purchase.payment_digest = payment_digest
+        purchase.status = COMPLETED
+        purchase.expires_ms = int(time.time() * 1000) + self.result_ttl_ms
+        heapq.heappush(self._expiry, (purchase.expires_ms, purchase.purchase_id))
+
+    def expire(self, now_ms=None):
+        """Expire pending purchases past their TTL and forget old results."""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now_ms:
+                expires_ms, purchase_id = heapq.heappop(self._expiry)
+                purchase = self._purchases.get(purchase_id)
+                if purchase is None or purchase.expires_ms != expires_ms:
+                    continue  # superseded entry
+                if purchase.status == PENDING:
+                    purchase.status = EXPIRED
+                    self._drop_expired(purchase)
+                    expired.append(purchase)
+                del self._purchases[purchase_id]
+        for purchase in expired:
+            self._notify(purchase)
+        return len(expired)
+
+    def _subscribe(self, purchase, callback):
+        """Run callback() once the purchase is no longer pending (now, if it already isn't)."""
+        with self._lock:
+            if purchase.status == PENDING:
+                if purchase.subscribers is None:
+                    purchase.subscribers = []
+                purchase.subscribers.append(callback)
+                return
+        callback()
+
+    def _unsubscribe(self, purchase, callback):
+        with self._lock:
+            if purchase.subscribers and callback in purchase.subscribers:
+                purchase.subscribers.remove(callback)
+
+    def _notify(self, purchase):
+        with self._lock:
+            subscribers, purchase.subscribers = purchase.subscribers, None
+        for callback in subscribers or ():
+            callback()
+
+    def wait(self, purchase, timeout):
+        """Block until the purchase leaves PENDING or `timeout` seconds pass."""
+        if purchase.status != PENDING or timeout <= 0:
+            return purchase
+        done = threading.Event()
+        self._subscribe(purchase, done.set)
+        try:
+            done.wait(min(timeout, max(0.0, purchase.expires_ms / 1000 - time.time())))
+        finally:
+            self._unsubscribe(purchase, done.set)
+        self.expire()
+        return purchase
+
+    async def wait_async(self, purchase, timeout):
+        """Coroutine version of wait(); parks on the running event loop, not a thread."""
+        if purchase.status != PENDING or timeout <= 0:
+            return purchase
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(None))
+        self._subscribe(purchase, wake)
+        try:
+            await asyncio.wait_for(done, min(timeout, max(0.0, purchase.expires_ms / 1000 - time.time())))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._unsubscribe(purchase, wake)
+        self.expire()
+        return purchase
+
+    def events(self, purchase, heartbeat=HEARTBEAT_SECONDS):
+        return PurchaseEvents(self, purchase, heartbeat)
+
+
+class PurchaseEvents:
+    """Server-sent event stream for one purchase.
+
+    Sends a `pending` event, then keep-alive comments every `heartbeat`
+    seconds, then one final `completed` or `expired` event. Iterating blocks
+    the calling thread; async iteration parks on the event loop instead.
+    """
+
+    def __init__(self, book, purchase, heartbeat=HEARTBEAT_SECONDS):
+        self.book = book
+        self.purchase = purchase
+        self.heartbeat = heartbeat
+
+    def _event(self):
+        return f'event: {self.purchase.status}\ndata: {json.dumps(self.purchase.as_dict())}\n\n'.encode('utf-8')
+
+    def __iter__(self):
+        yield self._event()
+        while self.purchase.status == PENDING:
+            self.book.wait(self.purchase, self.heartbeat)
+            yield self._event() if self.purchase.status != PENDING else b': keep-alive\n\n'
+
+    async def _aiter(self):
+        yield self._event()
+        while self.purchase.status == PENDING:
+            await self.book.wait_async(self.purchase, self.heartbeat)
+            yield self._event() if self.purchase.status != PENDING else b': keep-alive\n\n'
+
+    def __aiter__(self):
+        return self._aiter()
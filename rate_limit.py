@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Upper bound on (tier, key) buckets kept in memory; the least recently used are dropped first
+MAX_KEYS = 100_000
+
+
+class Tier:
+    """`rate` requests per second on average, with bursts of up to `burst` requests."""
+    __slots__ = ('rate', 'burst', 'interval', 'tolerance')
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst at least 1')
+        self.rate = rate
+        self.burst = burst
+        self.interval = 1.0 / rate
+        self.tolerance = burst * self.interval
+
+
+class RateLimiter:
+    """GCRA (virtual-scheduling token bucket) limiter with one bucket per (tier, key).
+
+    A bucket is a single float, its theoretical arrival time (TAT). A check
+    moves the TAT forward by one interval and refuses the request if that
+    would put it more than `burst` intervals ahead of now, so refill is lazy
+    and there are no timers. Buckets are kept in LRU order: one whose TAT has
+    passed is indistinguishable from a new one and is dropped when it reaches
+    the front, and the oldest are dropped beyond `max_keys`. Each check is O(1)
+    amortised.
+
+    `tiers` maps a tier name to a Tier (or a (rate, burst) pair); names
+    without a tier use `default`, and None means unlimited.
+    """
+
+    def __init__(self, tiers, default=None, max_keys=MAX_KEYS, clock=time.monotonic):
+        self.tiers = {name: _tier(tier) for name, tier in tiers.items()}
+        self.default = _tier(default)
+        self.max_keys = max_keys
+        self.clock = clock
+        self.limited = 0
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # (tier name, key) -> TAT
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def check(self, name, key):
+        """Count one request; returns 0.0 if allowed, else the seconds until it would be."""
+        tier = self.tiers.get(name, self.default)
+        if tier is None:
+            return 0.0
+        bucket = (name, key)
+        with self._lock:
+            now = self.clock()
+            tat = max(self._buckets.get(bucket, now), now) + tier.interval
+            wait = tat - now - tier.tolerance
+            if wait > 1e-9:   # slack for float rounding of the accumulated intervals
+                self.limited += 1
+                return wait
+            self._buckets[bucket] = tat
+            self._buckets.move_to_end(bucket)
+            self._evict(now)
+        return 0.0
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+        # Each bucket is dropped at most once, so this is O(1) amortised
+        while buckets:
+            bucket, tat = next(iter(buckets.items()))
+            if tat > now:
+                break
+            del buckets[bucket]
+
+
+def _tier(tier):
+    if tier is None or isinstance(tier, Tier):
+        return tier
+    return Tier(*tier)
+
+
+def unverified_token_id(token):
+    """The token_id claim of a JWT, read without verifying the signature.
+
+    Only good for choosing a rate-limit bucket before the token is validated;
+    returns None if the token cannot be parsed.
+    """
+    if not isinstance(token, str):
+        return None
+    parts = token.split('.')
+    if len(parts) != 3:
+        return None
+    segment = parts[1]
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4)))
+    except (ValueError, binascii.Error):
+        return None
+    token_id = payload.get('token_id') if isinstance(payload, dict) else None
+    return token_id if isinstance(token_id, str) else None
@@ -0,0 +1,89 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library is used instead
+    orjson = None
+
+# JSON backends, fastest first; 'orjson' is used when it is installed (it reads integers
+# beyond 64 bits as floats, which no JSON-RPC id or param here needs)
+BACKENDS = ('orjson', 'json') if orjson is not None else ('json',)
+# Error responses that are the same for every request except their id
+TEMPLATE_ERRORS = (
+    (-32700, 'Parse error'),
+    (-32600, 'Invalid Request'),
+    (-32601, 'Method not found'),
+    (-32600, 'No access: Missing token'),
+    (-32600, 'No access: Token expired'),
+    (-32600, 'No access: Invalid token'),
+    (-32001, 'Payment not received'),
+)
+
+_json_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def _json_dumps(obj):
+    return _json_encoder.encode(obj).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    try:
+        return orjson.dumps(obj)
+    except TypeError:
+        # orjson refuses some values the json module accepts, e.g. integers over 64 bits
+        return _json_dumps(obj)
+
+
+def _json_loads(data):
+    # Cheaper than letting json.loads sniff the encoding of bytes
+    return json.loads(data.decode('utf-8') if isinstance(data, bytes) else data)
+
+
+def set_backend(name):
+    """Select the JSON backend used by loads(), dumps() and encode_response().
+
+    loads() takes UTF-8 bytes (or str) and raises ValueError on malformed
+    input with either backend. dumps() returns UTF-8 bytes, and encode_response(response)
+    does the same for a JSON-RPC response object or batch list.
+    """
+    global backend, loads, dumps, encode_response
+    if name not in BACKENDS:
+        raise ValueError(f'Unavailable JSON backend: {name} (choose from {", ".join(BACKENDS)})')
+    backend = name
+    if name == 'orjson':
+        loads, dumps = orjson.loads, _orjson_dumps
+        encode_response = _orjson_dumps
+    else:
+        loads, dumps = _json_loads, _json_dumps
+        encode_response = _encode_templated
+
+
+# (code, message) -> encoded response up to its id
+_ERROR_PREFIXES = {
+    (code, message): _json_dumps({'jsonrpc': '2.0', 'error': {'code': code, 'message': message}})[:-1] + b',"id":'
+    for code, message in TEMPLATE_ERRORS
+}
+
+
+def _encode_templated(response):
+    """encode_response() for the json module, whose per-call overhead dominates small objects.
+
+    The fixed error objects are pre-encoded, so those responses only encode
+    their id. With orjson a single dumps() of the whole object is faster.
+    """
+    if isinstance(response, list):
+        return b'[' + b','.join([_encode_templated(item) for item in response]) + b']'
+    error = response.get('error')
+    if error is not None and len(error) == 2:
+        prefix = _ERROR_PREFIXES.get((error['code'], error['message']))
+        if prefix is not None:
+            rpc_id = response['id']
+            if rpc_id is None:
+                return prefix + b'null}'
+            if type(rpc_id) is int:
+                return prefix + str(rpc_id).encode('ascii') + b'}'
+            return prefix + dumps(rpc_id) + b'}'
+    return dumps(response)
+
+
+set_backend(BACKENDS[0])
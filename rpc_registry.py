@@ -0,0 +1,228 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+import jwt
+
+_MISSING = inspect.Parameter.empty
+
+log = logging.getLogger(__name__)
+
+
+class JSONRPCError(Exception):
+    """Raised by a method (or the dispatcher) to produce a JSON-RPC error response."""
+
+    def __init__(self, code, message, http_status=400, data=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.http_status = http_status
+        self.data = data
+
+
+class RequestContext:
+    """Per-call information handed to every registered method as its first argument."""
+    __slots__ = ('method', 'rpc_id', 'token', 'token_id', 'client')
+
+    def __init__(self, method, rpc_id, token=None, token_id=None, client=None):
+        self.method = method
+        self.rpc_id = rpc_id
+        self.token = token
+        self.token_id = token_id
+        self.client = client   # client IP address, when the transport knows it
+
+
+def _compile_params(func):
+    """Build a function mapping JSON-RPC params (list, dict or None) to call kwargs.
+
+    The method signature after the context argument is the param schema:
+    names, defaults, and optional type annotations that are checked with
+    isinstance. A *args parameter means surplus positional params are
+    accepted and dropped; otherwise they are an error. Everything is resolved
+    once here, not per request.
+    """
+    signature = inspect.signature(func)
+    fields = []
+    drop_surplus = False
+    for parameter in list(signature.parameters.values())[1:]:
+        if parameter.kind is inspect.Parameter.VAR_POSITIONAL:
+            drop_surplus = True
+            continue
+        annotation = parameter.annotation
+        expected = annotation if annotation is not _MISSING and isinstance(annotation, type) else None
+        fields.append((parameter.name, parameter.default, expected))
+    names = frozenset(name for name, _, _ in fields)
+    required = tuple(name for name, default, _ in fields if default is _MISSING)
+
+    def bind(params):
+        if params is None:
+            params = []
+        if isinstance(params, list):
+            if len(params) > len(fields):
+                if not drop_surplus:
+                    raise JSONRPCError(-32602, f'Invalid params: expected at most {len(fields)}')
+                params = params[:len(fields)]
+            kwargs = {fields[i][0]: value for i, value in enumerate(params)}
+        elif isinstance(params, dict):
+            unknown = params.keys() - names
+            if unknown:
+                raise JSONRPCError(-32602, f'Invalid params: unexpected {", ".join(sorted(unknown))}')
+            kwargs = dict(params)
+        else:
+            raise JSONRPCError(-32602, 'Invalid params: must be an array or an object')
+        for name in required:
+            if name not in kwargs:
+                raise JSONRPCError(-32602, f'Invalid params: missing {name}')
+        for name, default, expected in fields:
+            if expected is not None and name in kwargs and kwargs[name] is not default \
+                    and not isinstance(kwargs[name], expected):
+                raise JSONRPCError(-32602, f'Invalid params: {name} must be {expected.__name__}')
+        return kwargs
+
+    return bind
+
+
+class MethodSpec:
+    __slots__ = ('name', 'func', 'auth', 'is_async', 'bind')
+
+    def __init__(self, name, func, auth):
+        self.name = name
+        self.func = func
+        self.auth = auth
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.bind = _compile_params(func)
+
+
+class MethodRegistry:
+    """Name -> MethodSpec table and the dispatcher that routes requests through it.
+
+    Methods are registered with the @registry.method(...) decorator and take a
+    RequestContext followed by their params. Methods with auth=True receive the
+    caller's token either in the request's 'token' field or as params[0]; the
+    dispatcher validates it and strips it from the params before binding.
+    Coroutine methods run on a shared background event loop, unless the caller
+    dispatches with defer=True and awaits them on its own loop.
+
+    Every call is reported to the callables in `observers` as
+    observer(method, http_status, elapsed_seconds). If set, `admit(context,
+    token)` runs before the token is validated or the params are bound, and
+    may raise JSONRPCError to turn the call away (e.g. rate limiting).
+    """
+
+    def __init__(self):
+        self.methods = {}
+        self.observers = []
+        self.admit = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def method(self, name=None, auth=False):
+        def register(func):
+            method_name = name or func.__name__
+            if method_name in self.methods:
+                raise ValueError(f"Method already registered: {method_name}")
+            self.methods[method_name] = MethodSpec(method_name, func, auth)
+            return func
+        return register
+
+    def dispatch(self, json_request, validator, client=None, defer=False):
+        """Run one decoded request object and return (http_status, response_data).
+
+        With defer=True, a coroutine method is not run here: once its token and
+        params are checked, an awaitable of (http_status, response_data) is
+        returned for the caller's event loop to await.
+        """
+        if not isinstance(json_request, dict):
+            return 400, self._error(-32600, 'Invalid Request', None)
+
+        method = json_request.get('method')
+        rpc_id = json_request.get('id')
+        spec = self.methods.get(method) if isinstance(method, str) else None
+        if spec is None:
+            # Bad Request or 501 Not Implemented for method not found
+            return 400, self._error(-32601, 'Method not found', rpc_id)
+
+        started = time.perf_counter()
+        outcome = self._call(spec, json_request, rpc_id, validator, client, defer)
+        if inspect.isawaitable(outcome):
+            return self._finish(spec, outcome, started)
+        self._observe(spec, outcome[0], started)
+        return outcome
+
+    async def _finish(self, spec, outcome, started):
+        status, response_data = await outcome
+        self._observe(spec, status, started)
+        return status, response_data
+
+    def _observe(self, spec, status, started):
+        if self.observers:
+            elapsed = time.perf_counter() - started
+            for observer in self.observers:
+                observer(spec.name, status, elapsed)
+
+    def _call(self, spec, json_request, rpc_id, validator, client, defer=False):
+        params = json_request.get('params')
+        context = RequestContext(spec.name, rpc_id, client=client)
+        try:
+            token = None
+            if spec.auth:
+                token = json_request.get('token')
+                # If token not in body, it is the first positional param
+                if not token and isinstance(params, list) and params:
+                    token, params = params[0], params[1:]
+            if self.admit is not None:
+                self.admit(context, token)
+            if spec.auth:
+                if not token:
+                    return 401, self._error(-32600, 'No access: Missing token', rpc_id)
+                try:
+                    context.token_id = validator.validate(token)
+                except jwt.ExpiredSignatureError:
+                    return 401, self._error(-32600, 'No access: Token expired', rpc_id)
+                except jwt.InvalidTokenError:
+                    return 401, self._error(-32600, 'No access: Invalid token', rpc_id)
+                context.token = token
+
+            kwargs = spec.bind(params)
+            if spec.is_async:
+                if defer:
+                    return self._await_call(spec, spec.func(context, **kwargs), rpc_id)
+                result = self.run(spec.func(context, **kwargs))
+            else:
+                result = spec.func(context, **kwargs)
+            return 200, {'jsonrpc': '2.0', 'result': result, 'id': rpc_id}
+        except Exception as e:
+            return self._failure(spec, e, rpc_id)
+
+    async def _await_call(self, spec, coroutine, rpc_id):
+        try:
+            return 200, {'jsonrpc': '2.0', 'result': await coroutine, 'id': rpc_id}
+        except Exception as e:
+            return self._failure(spec, e, rpc_id)
+
+    def _failure(self, spec, error, rpc_id):
+        if isinstance(error, JSONRPCError):
+            return error.http_status, self._error(error.code, error.message, rpc_id, error.data)
+        log.error("Unhandled exception in %s", spec.name, exc_info=error)
+        return 500, self._error(-32603, f'Internal error: {str(error)}', rpc_id)
+
+    def run(self, coroutine):
+        """Run `coroutine` on the shared background event loop and return its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._event_loop()).result()
+
+    def _event_loop(self):
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='rpc-async', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    @staticmethod
+    def _error(code, message, rpc_id, data=None):
+        error = {'code': code, 'message': message}
+        if data is not None:
+            error['data'] = data
+        return {'jsonrpc': '2.0', 'error': error, 'id': rpc_id}
@@ -0,0 +1,120 @@
+import json
+import os
+
+# Environment variables named MCP_<SETTING> override a setting, e.g. MCP_SECRET_KEY or MCP_PORT
+ENV_PREFIX = 'MCP_'
+# Environment variable naming a JSON file of settings, e.g. {"PORT": 8081, "SUI_RPC_URL": "..."}
+CONFIG_FILE_ENV = 'MCP_CONFIG_FILE'
+
+
+class ConfigError(ValueError):
+    """A config file or environment variable names an unknown setting or has a bad value."""
+
+
+def load_config(settings, environ=None, checks=None):
+    """Return the overridden settings as {name: value}.
+
+    `settings` declares every setting that may be overridden, mapping its name
+    to a type or a tuple of types, where None allows null, e.g.
+    {'PORT': int, 'WORKERS': (int, None)}. Values come from the JSON object in
+    the file named by $MCP_CONFIG_FILE, then from MCP_<NAME> environment
+    variables, which win. Environment values are taken as plain strings for
+    str settings, and parsed as JSON otherwise (MCP_PORT=8081, MCP_WORKERS=null,
+    MCP_RATE_LIMIT_PER_IP=[50, 100]). A value of an undeclared type raises ConfigError.
+
+    `checks` maps some settings to a function that validates their value once
+    its type is right, returning it (possibly normalised) or raising ValueError,
+    e.g. {'SERVER_MODE': one_of(SERVER_MODES), 'RATE_LIMIT_PER_IP': rate_limit}.
+    """
+    environ = os.environ if environ is None else environ
+    checks = checks or {}
+    overrides = {}
+    path = environ.get(CONFIG_FILE_ENV)
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                values = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f'Cannot read {CONFIG_FILE_ENV}={path}: {e}') from e
+        if not isinstance(values, dict):
+            raise ConfigError(f'{path} must contain a JSON object')
+        unknown = values.keys() - settings.keys()
+        if unknown:
+            raise ConfigError(f'Unknown settings in {path}: {", ".join(sorted(unknown))}')
+        for name, value in values.items():
+            overrides[name] = _checked(name, value, settings[name], path, checks.get(name))
+
+    for name, types in settings.items():
+        source = ENV_PREFIX + name
+        text = environ.get(source)
+        if text is None:
+            continue
+        types = types if isinstance(types, tuple) else (types,)
+        if str in types:
+            value = text
+        else:
+            try:
+                value = json.loads(text)
+            except ValueError as e:
+                raise ConfigError(f'{source} is not valid JSON: {e}') from e
+        overrides[name] = _checked(name, value, types, source, checks.get(name))
+    return overrides
+
+
+def one_of(values):
+    """A check accepting only the given values."""
+    def check(value):
+        if value not in values:
+            raise ValueError(f'must be one of {", ".join(map(repr, values))}')
+        return value
+    return check
+
+
+def rate_limit(value):
+    """Check a [rate, burst] pair (requests per second, burst size), or None for no limit."""
+    if value is None:
+        return None
+    if len(value) == 2:
+        rate, burst = value
+        if isinstance(rate, (int, float)) and not isinstance(rate, bool) and rate > 0 \
+                and isinstance(burst, int) and not isinstance(burst, bool) and burst >= 1:
+            return tuple(value)
+    raise ValueError(f'must be [rate, burst] with rate > 0 and burst an integer >= 1, got {list(value)}')
+
+
+def rate_limits(value):
+    """Check a {name: [rate, burst] or None} mapping of rate limits."""
+    limits = {}
+    for name, limit in value.items():
+        if limit is not None and not isinstance(limit, (tuple, list)):
+            raise ValueError(f'{name} must be [rate, burst] or null')
+        try:
+            limits[name] = rate_limit(limit)
+        except ValueError as e:
+            raise ValueError(f'{name} {e}') from None
+    return limits
+
+
+def _checked(name, value, types, source, check=None):
+    types = types if isinstance(types, tuple) else (types,)
+    if value is None:
+        ok = None in types
+    elif isinstance(value, bool):
+        ok = bool in types
+    elif isinstance(value, int):
+        # An integer is fine where a float is expected, not the other way round
+        ok = int in types or float in types
+    elif isinstance(value, (tuple, list)):
+        ok = tuple in types or list in types
+        value = tuple(value) if tuple in types else list(value)
+    else:
+        ok = type(value) in types
+    if not ok:
+        expected = ' or '.join('null' if t is None else t.__name__ for t in types)
+        raise ConfigError(f'{source}: {name} must be {expected}, got {type(value).__name__}')
+    if check is not None:
+        try:
+            value = check(value)
+        except ValueError as e:
+            raise ConfigError(f'{source}: {name} {e}') from e
+    return value
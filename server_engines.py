@@ -0,0 +1,336 @@
+import asyncio
+import http.server
+import inspect
+import logging
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+log = logging.getLogger(__name__)
+
+# Serving engines selectable at startup (see simple_server.py --mode)
+SERVER_MODES = ('threaded', 'prefork', 'asyncio')
+# Listen backlog; the socketserver default of 5 drops connections under bursts
+REQUEST_QUEUE_SIZE = 128
+# Worker threads used by the asyncio engine to run blocking handlers (Sui lookups)
+ASYNCIO_EXECUTOR_THREADS = 32
+# Persistent connections: close after this many idle seconds or this many requests
+IDLE_TIMEOUT_SECONDS = 15
+MAX_REQUESTS_PER_CONNECTION = 1000
+# Largest accepted request body; bigger Content-Length values get 413 without being read
+MAX_BODY_BYTES = 1024 * 1024
+# A prefork worker exiting within this many seconds of its spawn counts as a failed start
+WORKER_MIN_UPTIME_SECONDS = 5.0
+# Prefork gives up after this many failed starts in a row
+MAX_FAILED_STARTS = 5
+# Delay before respawning after a second failed start in a row; doubles with each further one
+RESPAWN_BACKOFF_SECONDS = 0.1
+
+
+class ThreadingJSONRPCServer(http.server.ThreadingHTTPServer):
+    """One thread per connection, so a slow Sui lookup never blocks get_time/echo."""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+    def __init__(self, server_address, handler_class, bind_and_activate=True, reuse_port=False):
+        self.reuse_port = reuse_port
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def handle_error(self, request, client_address):
+        # socketserver prints the traceback to stderr; keep it in the JSON log instead
+        log.exception('Exception while handling a request from %s', client_address[0])
+
+
+def serve_threaded(host, port, handler_class, on_start=None):
+    """Run a thread-per-connection server until interrupted."""
+    with ThreadingJSONRPCServer((host, port), handler_class) as httpd:
+        if on_start:
+            on_start()
+        log.info('Serving JSON RPC on %s:%s (threaded)...', host, port)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            log.info('Shutting down server...')
+
+
+def _prefork_worker(host, port, handler_class, listen_socket, on_start):
+    """Body of a forked worker: a threaded server on its own (or the inherited) socket."""
+    # Both signals unwind through serve_forever so queued log records get flushed
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if listen_socket is None:
+        httpd = ThreadingJSONRPCServer((host, port), handler_class, reuse_port=True)
+    else:
+        # No SO_REUSEPORT: every worker accepts from the socket bound by the parent
+        httpd = ThreadingJSONRPCServer((host, port), handler_class, bind_and_activate=False)
+        httpd.socket.close()
+        httpd.socket = listen_socket
+    if on_start:
+        on_start()
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+
+
+def serve_prefork(host, port, handler_class, workers=None, on_start=None):
+    """Fork `workers` processes that share the port via SO_REUSEPORT.
+
+    The kernel load-balances new connections across workers, so throughput scales
+    with cores. The parent only supervises: dead workers are respawned and
+    SIGINT/SIGTERM are forwarded. `on_start` runs inside each worker after the fork,
+    which is where per-process background threads must be started.
+
+    The port is bound in the parent first, so a port in use raises OSError before
+    anything is forked. Workers that exit soon after their spawn are respawned with
+    a growing delay; after MAX_FAILED_STARTS of those in a row the remaining workers
+    are stopped and RuntimeError is raised.
+    """
+    workers = workers or os.cpu_count() or 1
+    listen_socket = None
+    if hasattr(socket, 'SO_REUSEPORT'):
+        # Probe only: workers bind their own sockets, and a socket that never listens gets no connections
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            probe.bind((host, port))
+    else:
+        log.warning('SO_REUSEPORT not available; workers will share a single listening socket.')
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.bind((host, port))
+        listen_socket.listen(REQUEST_QUEUE_SIZE)
+
+    children = {}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _prefork_worker(host, port, handler_class, listen_socket, on_start)
+            except KeyboardInterrupt:
+                pass
+            except Exception as e:
+                log.exception('Worker %d crashed: %s', os.getpid(), e)
+                code = 1
+            finally:
+                logging.shutdown()  # flush queued log records; os._exit skips atexit
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    for _ in range(workers):
+        spawn()
+    log.info('Serving JSON RPC on %s:%s (prefork, %d workers)...', host, port, workers)
+
+    stopping = False
+    failed_starts = 0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            except KeyboardInterrupt:
+                log.info('Shutting down server...')
+                stop(signal.SIGINT, None)
+                continue
+            spawned = children.pop(pid, None)
+            if stopping or spawned is None:
+                continue
+            if time.monotonic() - spawned < WORKER_MIN_UPTIME_SECONDS:
+                failed_starts += 1
+            else:
+                failed_starts = 0
+            if failed_starts >= MAX_FAILED_STARTS:
+                log.error('Workers keep exiting at startup (%d in a row); shutting down.', failed_starts)
+                stop(signal.SIGTERM, None)
+                continue
+            # A single early exit (e.g. a killed worker) is replaced at once
+            delay = RESPAWN_BACKOFF_SECONDS * 2 ** (failed_starts - 2) if failed_starts > 1 else 0
+            log.warning('Worker %d exited; respawning in %.1fs.', pid, delay)
+            try:
+                time.sleep(delay)
+            except KeyboardInterrupt:
+                log.info('Shutting down server...')
+                stop(signal.SIGINT, None)
+                continue
+            if not stopping:
+                spawn()
+    finally:
+        if listen_socket is not None:
+            listen_socket.close()
+    if failed_starts >= MAX_FAILED_STARTS:
+        raise RuntimeError(f'{failed_starts} prefork workers in a row exited within '
+                           f'{WORKER_MIN_UPTIME_SECONDS}s of starting')
+
+
+def request_body_length(transfer_encoding, content_lengths):
+    """Check a request's framing headers and return (refusal_status, body_length).
+
+    Only Content-Length framing is read. A request with a Transfer-Encoding (e.g.
+    chunked) or an ambiguous Content-Length is refused rather than guessed at,
+    since a wrong guess would read part of its body as the next request. The
+    connection must be closed after a refusal.
+    """
+    if transfer_encoding is not None:
+        return 501, 0
+    if not content_lengths:
+        return None, 0
+    value = content_lengths[0].strip()
+    if not (value.isascii() and value.isdigit()) or any(other.strip() != value for other in content_lengths):
+        return 400, 0
+    length = int(value)
+    if length > MAX_BODY_BYTES:
+        # Refused before reading, so a huge Content-Length can't allocate memory
+        return 413, 0
+    return None, length
+
+
+def _encode_head(status, headers, content_length, keep_alive):
+    lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}']
+    lines.extend(f'{name}: {value}' for name, value in headers)
+    if content_length is not None:
+        lines.append(f'Content-Length: {content_length}')
+    if not keep_alive:
+        lines.append('Connection: close')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1')
+
+
+def encode_response(status, headers, payload, keep_alive):
+    """A whole HTTP/1.1 response as bytes, so it can leave in a single write."""
+    return _encode_head(status, headers, len(payload), keep_alive) + payload
+
+
+async def _write_stream(writer, status, headers, payload, loop, executor):
+    """Send a streamed body: chunks as they come, delimited by closing the connection.
+
+    Async iterables are consumed on the event loop, so a stream that mostly
+    waits costs no thread; plain iterables are advanced in the executor.
+    """
+    writer.write(_encode_head(status, headers, None, keep_alive=False))
+    await writer.drain()
+    if hasattr(payload, '__aiter__'):
+        async for chunk in payload:
+            writer.write(chunk)
+            await writer.drain()
+    else:
+        chunks = iter(payload)
+        while True:
+            chunk = await loop.run_in_executor(executor, next, chunks, None)
+            if chunk is None:
+                break
+            writer.write(chunk)
+            await writer.drain()
+
+
+async def _asyncio_connection(reader, writer, app, executor):
+    """Serve HTTP/1.1 requests on one stream, with keep-alive and pipelining.
+
+    Requests are read and answered strictly in order; pipelined requests simply
+    wait in the stream buffer until the previous response has been written.
+    """
+    loop = asyncio.get_running_loop()
+    peer = writer.get_extra_info('peername')
+    client = peer[0] if peer else None
+    served = 0
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                break
+            request_line, *header_lines = head.decode('iso-8859-1').split('\r\n')
+            command, path, version = request_line.split(' ', 2)
+            headers = {}
+            content_lengths = []
+            for line in header_lines:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    name = name.strip().lower()
+                    headers[name] = value.strip()
+                    if name == 'content-length':
+                        content_lengths.append(value)
+            connection = headers.get('connection', '').lower()
+            if version == 'HTTP/1.1':
+                keep_alive = connection != 'close'
+            else:
+                keep_alive = connection == 'keep-alive'
+            served += 1
+            if served >= MAX_REQUESTS_PER_CONNECTION:
+                keep_alive = False
+
+            refusal, content_length = request_body_length(headers.get('transfer-encoding'), content_lengths)
+            if refusal:
+                writer.write(encode_response(refusal, [], b'', keep_alive=False))
+                await writer.drain()
+                break
+            if content_length and version == 'HTTP/1.1' and headers.get('expect', '').lower() == '100-continue':
+                # The client holds the body back until told to go ahead (curl waits 1s otherwise)
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                await writer.drain()
+            body = await reader.readexactly(content_length) if content_length else b''
+            # Handlers may block on Sui RPC calls, so they never run on the event loop itself
+            response = await loop.run_in_executor(executor, app, command, path, body, client)
+            if inspect.isawaitable(response):
+                # e.g. a long-poll: it waits on the event loop, not in an executor thread
+                response = await response
+            status, response_headers, payload = response
+            if not isinstance(payload, bytes):
+                await _write_stream(writer, status, response_headers, payload, loop, executor)
+                break
+            writer.write(encode_response(status, response_headers, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve_asyncio(host, port, app, on_start=None):
+    """Run an asyncio accept loop; `app(command, path, body, client_ip)` runs in a thread pool.
+
+    `app` returns (status, headers, payload), or an awaitable of that triple,
+    which is awaited on the event loop. A payload that is not bytes is an
+    (async) iterable of byte chunks, streamed until exhausted.
+    """
+    executor = ThreadPoolExecutor(max_workers=ASYNCIO_EXECUTOR_THREADS)
+
+    async def main():
+        server = await asyncio.start_server(
+            lambda r, w: _asyncio_connection(r, w, app, executor),
+            host, port, backlog=REQUEST_QUEUE_SIZE, reuse_address=True)
+        if on_start:
+            on_start()
+        log.info('Serving JSON RPC on %s:%s (asyncio)...', host, port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        log.info('Shutting down server...')
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,153 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+# Upper bound on records written per batch
+BATCH_SIZE = 256
+
+# JSON-RPC id of the request being handled by the current thread/task
+REQUEST_ID = contextvars.ContextVar('rpc_id', default=None)
+
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'rpc_id'}
+_STOP = object()
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, rpc_id, msg, plus any `extra` fields.
+
+    rpc_id is left out of records logged outside a JSON-RPC call (e.g. the access log).
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        rpc_id = getattr(record, 'rpc_id', None)
+        if rpc_id is not None:
+            entry['rpc_id'] = rpc_id
+        entry['msg'] = record.getMessage()
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _EnqueueHandler(logging.Handler):
+    """Hands records to the writer thread without formatting them on the caller's thread."""
+
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record):
+        record.rpc_id = REQUEST_ID.get()
+        if record.exc_info:
+            # Tracebacks must be rendered while the frames are still current
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        self.writer.queue.put(record)
+
+    def close(self):
+        # Called by logging.shutdown(): write out whatever is still queued
+        self.writer.stop()
+        super().close()
+
+
+class BatchingWriter:
+    """Background thread that drains the record queue and writes batches in one call."""
+
+    def __init__(self, stream, formatter):
+        self.stream = stream
+        self.formatter = formatter
+        self.queue = queue.SimpleQueue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = [record]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            lines = []
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.formatter.format(item))
+                except Exception:
+                    lines.append(json.dumps({'ts': time.time(), 'level': 'ERROR', 'msg': 'unformattable log record'}))
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    pass
+            if stop:
+                return
+
+
+_writer = None
+
+
+def configure_logging(level='INFO', stream=None):
+    """Route all logging through the background writer as JSON lines.
+
+    Safe to call again to change the level. The writer thread is restarted in
+    forked children (prefork workers), since threads do not survive fork.
+    """
+    global _writer
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _writer is not None:
+        return
+    _writer = BatchingWriter(stream or sys.stdout, JSONFormatter())
+    _writer.start()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_EnqueueHandler(_writer))
+    atexit.register(_writer.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def _restart_after_fork():
+    # The parent's queue may hold records it will write itself; start clean
+    _writer.queue = queue.SimpleQueue()
+    _writer.start()
+
+
+def set_request_id(rpc_id):
+    """Tag log records from the current thread/task with a JSON-RPC id; returns a reset token."""
+    return REQUEST_ID.set(rpc_id)
+
+
+def reset_request_id(token):
+    REQUEST_ID.reset(token)
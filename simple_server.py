@@ -1,284 +1,595 @@
+import argparse
+import asyncio
+import functools
 import http.server
-import socketserver
-import json
+import inspect
+import logging
+import math
 import time
 import jwt
 import uuid
 from datetime import datetime, timedelta, timezone
 from email.utils import formatdate
-from pysui import SuiConfig, SyncClient, SuiRpcResult
-from pysui.sui import sui_txresults
-from pysui.sui.sui_builders.get_builders import QueryTransactions, GetMultipleTx, GetTx
-from pysui.sui.sui_types.transaction_filter import ToAddressQuery
-from pysui.sui.sui_types.collections import SuiArray
-from pysui.sui.sui_types.scalars import SuiString
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+import server_engines
+import server_logging
+import server_config
+from metrics import METRICS
+from rpc_registry import MethodRegistry, JSONRPCError
+from sui_access import SuiAccess, SuiUnavailableError, load_pysui
+from sui_indexer import SuiPaymentIndexer
+from payment_ledger import open_payment_ledger
+from purchases import PurchaseBook
+from rate_limit import RateLimiter, unverified_token_id
+import rpc_codec
+from token_validation import TokenValidator, TokenExpirySweeper, BatchTokenValidator
+from token_store import open_token_store, TOKEN_STORE_BACKENDS
 
 PORT = 8080
 HOST = '0.0.0.0'
 # Secret key for signing JWT tokens
 SECRET_KEY = "your-secret-key-for-jwt-tokens"
-# Store issued tokens (in a real application, this would be in a database)
-ISSUED_TOKENS = {}
+# Where issued tokens and claimed payments are kept: 'memory' (per process) or 'sqlite'
+# (on disk, shared by every worker process, and kept across restarts; required for prefork)
+TOKEN_STORE_BACKEND = 'memory'
+TOKEN_STORE_PATH = 'issued_tokens.db'
 # Sui Address to monitor
 SUI_ADDRESS_TO_MONITOR = "0x95831b91dc0d4761530daa520274cc7bb1256b579784d7d223814c3f05c45b26"
 # Sui RPC URL (replace with your desired network: devnet, testnet, mainnet)
 # For example, for devnet: "https://fullnode.devnet.sui.io:443"
 # For mainnet: "https://fullnode.mainnet.sui.io:443"
 SUI_RPC_URL = "https://fullnode.mainnet.sui.io:443" # Defaulting to mainnet
+# Log level: 'DEBUG', 'INFO', 'WARNING' or 'ERROR'. Records are JSON lines written by a background thread.
+LOG_LEVEL = 'INFO'
+# Serving engine: 'threaded', 'prefork' (multi-process, SO_REUSEPORT) or 'asyncio'
+SERVER_MODE = 'threaded'
+# Worker processes for prefork mode (None = one per CPU core)
+WORKERS = None
+# Largest accepted JSON-RPC batch, and threads used to run batch elements concurrently
+MAX_BATCH_SIZE = 100
+BATCH_WORKERS = 16
+# A payment can be claimed if it landed on chain within this window before the purchase call.
+# Each payment backs exactly one token, so the window can be generous.
+PAYMENT_WINDOW_MS = 10 * 60 * 1000
+# Minimum SUI (in MIST) a payment must credit to SUI_ADDRESS_TO_MONITOR; None accepts any transaction
+MIN_PAYMENT_MIST = None
+# purchase_token re-syncs the payment index on a miss, unless a sync finished within this many
+# seconds; concurrent misses share one in-flight sync
+CHAIN_FRESHNESS_SECONDS = 0.5
+# If the payment indexer has not completed a sync for this long, purchase_token answers
+# -32002 (retry later) rather than 402 (pay)
+INDEX_STALE_SECONDS = 30
+# Longest purchase_status long-poll, in seconds
+LONG_POLL_MAX_SECONDS = 30
+# Server-sent events for one purchase: GET /purchases/<purchase_id>/events
+PURCHASE_EVENTS_PATH = '/purchases/{}/events'
+# Rate limits as (requests per second, burst), enforced before any JWT or Sui work.
+# RATE_LIMIT_PER_IP applies to every HTTP request from a client address. Per-method
+# limits apply per client address and token_id for calls that carry a token, and per
+# client address for the others; methods not listed use RATE_LIMIT_DEFAULT. None
+# disables a limit.
+RATE_LIMIT_PER_IP = (100.0, 200)
+RATE_LIMIT_METHODS = {
+    'purchase_token': (1.0, 5),    # unauthenticated, and a miss costs a fullnode sync
+    'request_purchase': (1.0, 5),
+    'purchase_status': (2.0, 10),
+}
+RATE_LIMIT_DEFAULT = (20.0, 40)
+# Prometheus scrape endpoint (GET)
+METRICS_PATH = '/metrics'
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Response headers for JSON-RPC replies (bodies are encoded by rpc_codec)
+JSON_HEADERS = (('Content-type', 'application/json'),)
 
-# Initialize Sui Client
-try:
-    sui_config = SuiConfig.default_config() # Or use SuiConfig.from_config_file(...)
-    # Attempt to use an existing environment if available, otherwise, create a new one based on RPC URL
-    if sui_config.rpc_url != SUI_RPC_URL and SUI_RPC_URL:
-        sui_config.rpc_url = SUI_RPC_URL
-        sui_config.active_address = None # No specific address needed for querying public data
-    sui_client = SyncClient(sui_config)
-    print(f"Successfully connected to Sui network: {sui_config.rpc_url}")
-except Exception as e:
-    print(f"Error initializing Sui client: {e}")
-    sui_client = None
+# Settings that a JSON file named in $MCP_CONFIG_FILE and MCP_<NAME> environment variables
+# (e.g. MCP_SECRET_KEY, MCP_PORT or MCP_SUI_RPC_URL) may override, with their types;
+# None allows null. Rate limits are [rate, burst] arrays.
+SETTINGS = {
+    'PORT': int,
+    'HOST': str,
+    'SECRET_KEY': str,
+    'TOKEN_STORE_BACKEND': str,
+    'TOKEN_STORE_PATH': str,
+    'SUI_ADDRESS_TO_MONITOR': str,
+    'SUI_RPC_URL': str,
+    'LOG_LEVEL': str,
+    'SERVER_MODE': str,
+    'WORKERS': (int, None),
+    'MAX_BATCH_SIZE': int,
+    'BATCH_WORKERS': int,
+    'PAYMENT_WINDOW_MS': int,
+    'MIN_PAYMENT_MIST': (int, None),
+    'CHAIN_FRESHNESS_SECONDS': float,
+    'INDEX_STALE_SECONDS': float,
+    'LONG_POLL_MAX_SECONDS': float,
+    'RATE_LIMIT_PER_IP': (tuple, None),
+    'RATE_LIMIT_METHODS': dict,
+    'RATE_LIMIT_DEFAULT': (tuple, None),
+}
+# Further checks on the values of some settings
+SETTING_CHECKS = {
+    'TOKEN_STORE_BACKEND': server_config.one_of(TOKEN_STORE_BACKENDS),
+    'LOG_LEVEL': server_config.one_of(server_logging.LOG_LEVELS),
+    'SERVER_MODE': server_config.one_of(server_engines.SERVER_MODES),
+    'RATE_LIMIT_PER_IP': server_config.rate_limit,
+    'RATE_LIMIT_METHODS': server_config.rate_limits,
+    'RATE_LIMIT_DEFAULT': server_config.rate_limit,
+}
+CONFIG_OVERRIDES = server_config.load_config(SETTINGS, checks=SETTING_CHECKS)
+globals().update(CONFIG_OVERRIDES)
 
-class JSONRPCRequestHandler(http.server.BaseHTTPRequestHandler):
-    def do_POST(self):
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length)
+server_logging.configure_logging(LOG_LEVEL)
+log = logging.getLogger('simple_server')
+
+# Pooled fullnode access; clients connect on first use, so startup does not need the network
+SUI_ACCESS = SuiAccess(SUI_RPC_URL)
+
+# Store issued tokens (see token_store.py)
+ISSUED_TOKENS = open_token_store(TOKEN_STORE_BACKEND, TOKEN_STORE_PATH)
+# Verifies access tokens, caching already-verified token strings
+TOKEN_VALIDATOR = TokenValidator(SECRET_KEY, ISSUED_TOKENS)
+# Removes expired entries from ISSUED_TOKENS in the background
+TOKEN_SWEEPER = TokenExpirySweeper(ISSUED_TOKENS.remove)
+
+# JSON-RPC methods, registered below with @REGISTRY.method
+REGISTRY = MethodRegistry()
+# Runs the elements of a JSON-RPC batch in parallel
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='rpc-batch')
+
+# Token buckets for the limits above; HTTP_RATE_TIER is the name of the per-IP tier
+HTTP_RATE_TIER = ':http'
+RATE_LIMITER = RateLimiter({**RATE_LIMIT_METHODS, HTTP_RATE_TIER: RATE_LIMIT_PER_IP}, default=RATE_LIMIT_DEFAULT)
+
+# Payments seen on chain and whether a token has been issued against them; with the
+# 'sqlite' backend a payments table in TOKEN_STORE_PATH shared by every process
+PAYMENT_LEDGER = open_payment_ledger(TOKEN_STORE_BACKEND, TOKEN_STORE_PATH)
+# Purchases started with request_purchase, completed as matching payments are indexed
+PURCHASES = PurchaseBook(
+    claim=lambda since_ms, digest, sender: PAYMENT_LEDGER.claim(
+        since_ms, digest=digest, sender=sender, min_amount=MIN_PAYMENT_MIST),
+    issue=lambda: issue_token(),  # defined with the RPC methods below
+    window_ms=PAYMENT_WINDOW_MS
+)
+# Purchases live in the memory of one process, so prefork mode turns them off: a
+# status or event request on another connection could reach a different worker
+PURCHASES_ENABLED = True
+
+def observe_rpc(method, http_status, elapsed):
+    labels = (('method', method), ('status', http_status))
+    METRICS.inc('rpc_requests_total', labels)
+    METRICS.observe('rpc_request_duration_seconds', elapsed, labels)
+
+REGISTRY.observers.append(observe_rpc)
+
+def admit_rpc(ctx, token):
+    """Rate-limit a call by client address and, when it carries a token, its token_id."""
+    if ctx.client is None:
+        return  # in-process call, no address to limit
+    # The token is not verified yet, so its token_id only splits the client's own bucket: a
+    # made-up token_id gets a fresh bucket but fails validation before the method runs (the
+    # per-IP HTTP tier still counts it), and other clients can't drain a real token's bucket.
+    token_id = unverified_token_id(token) if token else None
+    key = ('ip', ctx.client) if token_id is None else ('token', ctx.client, token_id)
+    retry_after = RATE_LIMITER.check(ctx.method, key)
+    if retry_after:
+        METRICS.inc('rate_limited_total', (('scope', ctx.method),))
+        raise JSONRPCError(-32005, 'Rate limit exceeded', 429, data={'retry_after': round(retry_after, 3)})
+
+REGISTRY.admit = admit_rpc
+
+def http_requests_in_flight():
+    snapshot = METRICS.snapshot()
+    started = snapshot.counters.get(('http_requests_started_total', ()), 0)
+    finished = sum(value for (name, _), value in snapshot.counters.items() if name == 'http_requests_total')
+    return started - finished
+
+METRICS.gauge('http_requests_in_flight', 'HTTP requests currently being processed.', http_requests_in_flight)
+METRICS.gauge('token_store_size', 'Issued tokens held by the token store.', lambda: len(ISSUED_TOKENS))
+METRICS.gauge('token_cache_size', 'Verified token strings held by the validator cache.', lambda: len(TOKEN_VALIDATOR.cache))
+METRICS.counter('token_cache_lookups_total', 'Validator cache lookups of token strings, by result.',
+                lambda: {(('result', 'hit'),): TOKEN_VALIDATOR.cache.hits,
+                         (('result', 'miss'),): TOKEN_VALIDATOR.cache.misses})
+METRICS.gauge('sui_circuit_open', 'Whether calls to the Sui fullnode are failing fast (1) or not (0).',
+              lambda: int(SUI_ACCESS.degraded))
+METRICS.gauge('purchases_size', 'Purchases (pending or recently completed) held by the purchase book.',
+              lambda: len(PURCHASES))
+METRICS.gauge('payment_ledger_size', 'Payments held by the payment ledger.', lambda: len(PAYMENT_LEDGER))
+METRICS.gauge('rate_limit_buckets', 'Rate-limit buckets held in memory.', lambda: len(RATE_LIMITER))
+
+def record_payment(digest, timestamp_ms, sender, amount, backfill):
+    # Payments found by the startup backfill may already have been redeemed. A persistent
+    # ledger that has completed a sync before remembers which, so they stay claimable. A new
+    # ledger (in memory, or a fresh SQLite file) cannot tell, so it records them as consumed;
+    # a payment made just before such a start is then lost.
+    consumed = backfill and not PAYMENT_LEDGER.initialized()
+    if PAYMENT_LEDGER.record(digest, timestamp_ms, sender=sender, amount=amount, consumed=consumed) \
+            and not backfill:
+        PURCHASES.offer(digest, timestamp_ms, sender)
+
+def index_synced():
+    PAYMENT_LEDGER.prune()
+    PAYMENT_LEDGER.mark_synced()
+    PAYMENT_LEDGER.mark_initialized()
+
+# Background follower of SUI_ADDRESS_TO_MONITOR, started by start_background_services(). With a
+# shared ledger, a lock file elects one indexer per host; the other processes only claim.
+PAYMENT_INDEXER = SuiPaymentIndexer(
+    SUI_ACCESS, SUI_ADDRESS_TO_MONITOR, on_payment=record_payment, on_sync=index_synced,
+    is_known=lambda digest: digest in PAYMENT_LEDGER, freshness=CHAIN_FRESHNESS_SECONDS,
+    lock_path=TOKEN_STORE_PATH + '.indexer.lock' if PAYMENT_LEDGER.persistent else None
+)
+
+def start_background_services():
+    """Start per-process background threads (called after fork in prefork mode)."""
+    # Tokens issued before a restart are not in this process's sweeper heap
+    ISSUED_TOKENS.purge_expired()
+    TOKEN_SWEEPER.start()
+    PAYMENT_INDEXER.start()
+
+def handle_rpc_payload(post_data, client=None, defer=False):
+    """Process a raw JSON-RPC request body and return (http_status, response_data).
+
+    response_data is None when there is nothing to send back (a batch made only
+    of notifications). With defer=True, a request to a coroutine method, alone or
+    in a batch, returns an awaitable of the pair instead (see MethodRegistry.dispatch).
+    """
+    try:
+        json_request = rpc_codec.loads(post_data)
+    except ValueError:
+        response_data = {
+            'jsonrpc': '2.0',
+            'error': {'code': -32700, 'message': 'Parse error'},
+            'id': None
+        }
+        return 400, response_data
+
+    if isinstance(json_request, list):
+        return handle_rpc_batch(json_request, client, defer)
+    return handle_rpc_request(json_request, client=client, defer=defer)
+
+def handle_rpc_batch(batch, client=None, defer=False):
+    """Dispatch every element of a JSON-RPC batch, concurrently when there are several.
+
+    Notifications (elements without an 'id') are executed but get no entry in
+    the response. A token shared by several elements is verified only once.
+    Coroutine methods (purchase_status long-polls) don't hold a BATCH_EXECUTOR
+    thread while they wait: they are awaited together on an event loop, the
+    caller's with defer=True (an awaitable of the pair is returned), otherwise
+    the registry's background loop.
+    """
+    if not batch or len(batch) > MAX_BATCH_SIZE:
+        message = 'Invalid Request' if not batch else f'Invalid Request: batch larger than {MAX_BATCH_SIZE}'
+        response_data = {
+            'jsonrpc': '2.0',
+            'error': {'code': -32600, 'message': message},
+            'id': None
+        }
+        return 400, response_data
+
+    validator = BatchTokenValidator(TOKEN_VALIDATOR)
+    if len(batch) == 1:
+        results = [handle_rpc_request(batch[0], validator, client, defer=True)]
+    else:
+        results = list(BATCH_EXECUTOR.map(
+            lambda element: handle_rpc_request(element, validator, client, defer=True), batch))
+
+    if any(inspect.isawaitable(result) for result in results):
+        gathered = _gathered_batch(batch, results)
+        return gathered if defer else REGISTRY.run(gathered)
+    return _batch_response(batch, results)
+
+async def _gathered_batch(batch, results):
+    pending = [i for i, result in enumerate(results) if inspect.isawaitable(result)]
+    for i, outcome in zip(pending, await asyncio.gather(*(results[i] for i in pending))):
+        results[i] = outcome
+    return _batch_response(batch, results)
+
+def _batch_response(batch, results):
+    responses = [
+        response_data
+        for element, (_, response_data) in zip(batch, results)
+        if not (isinstance(element, dict) and 'id' not in element)
+    ]
+    if not responses:
+        return 204, None
+    return 200, responses
+
+def issue_token():
+    """Create, record and return a new JWT that expires in one hour."""
+    token_id = str(uuid.uuid4())
+    expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    payload = {
+        'token_id': token_id,
+        'exp': expiration # JWT library handles datetime objects
+    }
+
+    # Create the JWT token
+    new_token = jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+    # Store token info as epoch seconds
+    ISSUED_TOKENS.add(token_id, time.time(), expiration.timestamp())
+    TOKEN_SWEEPER.schedule(token_id, expiration.timestamp())
+    return new_token
+
+def claim_payment(now_utc_ms, digest, sender):
+    return PAYMENT_LEDGER.claim(
+        now_utc_ms - PAYMENT_WINDOW_MS,
+        digest=digest,
+        sender=sender,
+        min_amount=MIN_PAYMENT_MIST
+    )
 
-        response_data = {}
-        rpc_id = None
+@REGISTRY.method('purchase_token')
+def rpc_purchase_token(ctx, digest: str = None, sender: str = None):
+    """Issue a JWT against one unconsumed payment; `digest`/`sender` narrow the claim."""
+    # The indexer may run in another worker, so its progress is read from the ledger
+    synced_ms = PAYMENT_LEDGER.synced_ms()
+    if synced_ms is None:
+        if SUI_ACCESS.degraded:
+            raise JSONRPCError(-32002, 'Sui network unavailable', 503)
+        log.warning("[purchase_token] Payment index not synced yet.")
+        raise JSONRPCError(-32000, 'Payment index not ready', 503)
 
+    now_utc_ms = int(time.time() * 1000)
+    payment = claim_payment(now_utc_ms, digest, sender)
+    if payment is None and not SUI_ACCESS.degraded:
+        # The payment may have landed since the last poll: catch the index up once.
+        # A burst of misses shares one fullnode round trip (see SuiPaymentIndexer.refresh).
         try:
-            json_request = json.loads(post_data.decode('utf-8'))
-            method = json_request.get('method')
-            original_params = json_request.get('params') # Store original params
-            rpc_id = json_request.get('id')
-            
-            token_from_body = json_request.get('token') # Attempt to get token from body field
-            effective_params = original_params # Params to be used by methods
-
-            if method == 'purchase_token':
-                print("[purchase_token] Entered method.")
-                if not sui_client:
-                    print("[purchase_token] Sui client not initialized.")
-                    response_data = {
-                        'jsonrpc': '2.0',
-                        'error': {'code': -32000, 'message': 'Sui client not initialized'},
-                        'id': rpc_id
-                    }
-                    self.send_response(500)
-                else:
-                    print("[purchase_token] Sui client initialized. Proceeding with payment check.")
-                    payment_received = False
-                    try:
-                        print("[purchase_token] Attempting Sui transaction query (2-phase approach).")
-                        
-                        # Phase 1: Get transaction digests
-                        print("[purchase_token] Phase 1: Fetching transaction digests.")
-                        to_address_filter = ToAddressQuery(address=SUI_ADDRESS_TO_MONITOR)
-                        query_builder_digests = QueryTransactions(
-                            query=to_address_filter, 
-                            cursor=None,
-                            limit=10, 
-                            descending_order=True
-                        )
-                        print(f"[purchase_token] Digest query builder params: {query_builder_digests.params}")
-                        result_digests: SuiRpcResult = sui_client.execute(query_builder_digests)
-                        
-                        transaction_digests_list = []
-                        if result_digests.is_ok() and result_digests.result_data and hasattr(result_digests.result_data, 'data') and result_digests.result_data.data:
-                            transaction_digests_list = [tx.digest for tx in result_digests.result_data.data if hasattr(tx, 'digest') and tx.digest]
-                            print(f"[purchase_token] Found {len(transaction_digests_list)} digests: {transaction_digests_list}")
-                        else:
-                            print(f"[purchase_token] Phase 1 (QueryTransactions) failed or no digests found: {result_digests.result_string if hasattr(result_digests, 'result_string') else 'No error string'}")
-
-                        if transaction_digests_list:
-                            print("[purchase_token] Phase 2: Fetching transaction details for digests.")
-                            tx_options_dict = GetTx.default_options()
-                            # Optionally ensure critical fields for timestamp are requested if default is not enough
-                            # tx_options_dict["showInput"] = True # Already default
-                            print(f"[purchase_token] Using options for GetMultipleTx: {tx_options_dict}")
-
-                            sui_digest_array = SuiArray([SuiString(d) for d in transaction_digests_list])
-                            get_multiple_tx_builder = GetMultipleTx(digests=sui_digest_array, options=tx_options_dict)
-                            detailed_tx_result: SuiRpcResult = sui_client.execute(get_multiple_tx_builder)
-
-                            if detailed_tx_result.is_ok():
-                                print(f"[purchase_token] GetMultipleTx successful. Result data type: {type(detailed_tx_result.result_data)}")
-                                detailed_txs_data = detailed_tx_result.result_data
-                                actual_tx_list = []
-                                if hasattr(detailed_txs_data, 'transactions') and isinstance(detailed_txs_data.transactions, list):
-                                    actual_tx_list = detailed_txs_data.transactions
-                                elif hasattr(detailed_txs_data, 'data') and isinstance(detailed_txs_data.data, list):
-                                    actual_tx_list = detailed_txs_data.data # Fallback, though TxResponseArray uses .transactions
-                                
-                                if actual_tx_list:
-                                    print(f"[purchase_token] Processing {len(actual_tx_list)} detailed transactions from GetMultipleTx.")
-                                    now_utc_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
-                                    ten_seconds_ago_ms = now_utc_ms - 10000
-                                    print(f"[purchase_token] Current time window for check: {ten_seconds_ago_ms}ms to {now_utc_ms}ms.")
-                                    for tx_block in actual_tx_list:
-                                        # Accessing attributes directly from the TxResponse objects within TxResponseArray
-                                        tx_digest = tx_block.digest if hasattr(tx_block, 'digest') else 'N/A'
-                                        tx_timestamp_ms = tx_block.timestamp_ms if hasattr(tx_block, 'timestamp_ms') else None
-                                        print(f"[purchase_token] Checking detailed tx: Digest={tx_digest}, TimestampMs={tx_timestamp_ms}")
-                                        if tx_timestamp_ms and int(tx_timestamp_ms) >= ten_seconds_ago_ms:
-                                            print(f"[purchase_token] Found recent transaction via GetMultipleTx: {tx_digest}")
-                                            payment_received = True
-                                            break
-                                else:
-                                    print("[purchase_token] GetMultipleTx returned OK, but no transactions found in the response list.")
-                            else:
-                                print(f"[purchase_token] Phase 2 (GetMultipleTx) failed: {detailed_tx_result.result_string if hasattr(detailed_tx_result, 'result_string') else 'No error string'}")
-                        else:
-                            print("[purchase_token] No transaction digests found in Phase 1 to fetch details for.")
-
-                    except Exception as e_sui:
-                        print("[purchase_token] --- Exception during Sui transaction check ---")
-                        traceback.print_exc()
-                        print("---------------------------------------------------------")
-                        # payment_received remains False
-
-                    print(f"[purchase_token] Payment received status: {payment_received}")
-                    if payment_received:
-                        print("[purchase_token] Payment received. Generating token.")
-                        # Generate a new JWT token
-                        token_id = str(uuid.uuid4())
-                        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
-                        
-                        payload = {
-                            'token_id': token_id,
-                            'exp': expiration # JWT library handles datetime objects
-                        }
-                        
-                        # Create the JWT token
-                        new_token = jwt.encode(payload, SECRET_KEY, algorithm='HS256')
-                        
-                        # Store token info (in a real app, use a database)
-                        ISSUED_TOKENS[token_id] = {
-                            'created_at': datetime.now(timezone.utc),
-                            'expires_at': expiration
-                        }
-                        
-                        response_data = {'jsonrpc': '2.0', 'result': new_token, 'id': rpc_id}
-                        self.send_response(200)
-                    else:
-                        print("[purchase_token] Payment not received. Returning 402.")
-                        response_data = {
-                            'jsonrpc': '2.0',
-                            'error': {'code': -32001, 'message': 'Payment not received'},
-                            'id': rpc_id
-                        }
-                        self.send_response(402) # Payment Required
-            elif method in ['get_time', 'echo']:
-                token_to_validate = token_from_body
-                
-                # If token not in body, try to extract from original_params[0]
-                if not token_to_validate and isinstance(original_params, list) and len(original_params) > 0:
-                    token_to_validate = original_params[0] # Assume this is the token
-                    
-                    # Adjust effective_params for the actual method logic
-                    if method == 'echo':
-                        effective_params = original_params[1:] if len(original_params) > 1 else []
-                    else: # for get_time
-                        effective_params = []
-
-                if not token_to_validate:
-                    response_data = {
-                        'jsonrpc': '2.0',
-                        'error': {'code': -32600, 'message': 'No access: Missing token'},
-                        'id': rpc_id
-                    }
-                    self.send_response(401)
-                else:
-                    try:
-                        # Decode and verify the token_to_validate
-                        payload = jwt.decode(token_to_validate, SECRET_KEY, algorithms=['HS256'])
-                        token_id = payload.get('token_id')
-                        
-                        if token_id not in ISSUED_TOKENS:
-                            raise jwt.InvalidTokenError("Token not found in issued tokens")
-                        
-                        # Check if token has expired based on our stored 'expires_at'
-                        # Corrected to use timezone-aware datetime
-                        # Ensure ISSUED_TOKENS[token_id]['expires_at'] is timezone-aware if it comes from old data
-                        expires_at_val = ISSUED_TOKENS[token_id]['expires_at']
-                        if not expires_at_val.tzinfo:
-                           expires_at_val = expires_at_val.replace(tzinfo=timezone.utc)
-
-                        if expires_at_val < datetime.now(timezone.utc):
-                            ISSUED_TOKENS.pop(token_id) # Clean up expired token from memory
-                            raise jwt.ExpiredSignatureError("Token has expired based on server record")
-
-                        if method == 'get_time':
-                            current_time_gmt = formatdate(timeval=None, localtime=False, usegmt=True)
-                            response_data = {'jsonrpc': '2.0', 'result': current_time_gmt, 'id': rpc_id}
-                            self.send_response(200)
-                        elif method == 'echo':
-                            # Use effective_params for echo logic
-                            if isinstance(effective_params, list) and len(effective_params) > 0:
-                                modified_response = f"Dear User, {effective_params[0]}"
-                            else:
-                                modified_response = "Dear User"
-                            response_data = {'jsonrpc': '2.0', 'result': modified_response, 'id': rpc_id}
-                            self.send_response(200)
-                            
-                    except jwt.ExpiredSignatureError:
-                        response_data = {
-                            'jsonrpc': '2.0',
-                            'error': {'code': -32600, 'message': 'No access: Token expired'},
-                            'id': rpc_id
-                        }
-                        self.send_response(401)
-                    except jwt.InvalidTokenError:
-                        response_data = {
-                            'jsonrpc': '2.0', 
-                            'error': {'code': -32600, 'message': 'No access: Invalid token'},
-                            'id': rpc_id
-                        }
-                        self.send_response(401)
-            else:
-                response_data = {
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32601, 'message': 'Method not found'},
-                    'id': rpc_id
-                }
-                self.send_response(400) # Bad Request or 501 Not Implemented for method not found
-
-        except json.JSONDecodeError:
-            response_data = {
-                'jsonrpc': '2.0',
-                'error': {'code': -32700, 'message': 'Parse error'},
-                'id': None
-            }
-            self.send_response(400)
-        except Exception as e:
-            print("---Outer Exception Caught ( منجر به 500) ---")
-            traceback.print_exc()
-            print("--------------------------------------------")
-            response_data = {
-                'jsonrpc': '2.0',
-                'error': {'code': -32603, 'message': f'Internal error: {str(e)}'},
-                'id': rpc_id
-            }
-            self.send_response(500)
-
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(response_data).encode('utf-8'))
+            PAYMENT_INDEXER.refresh()
+        except SuiUnavailableError as e:
+            log.debug("[purchase_token] Index refresh failed: %s", e)
+        except Exception:
+            log.warning("[purchase_token] Index refresh failed", exc_info=True)
+        payment = claim_payment(now_utc_ms, digest, sender)
+    if payment is None:
+        stale = now_utc_ms - (PAYMENT_LEDGER.synced_ms() or synced_ms) > INDEX_STALE_SECONDS * 1000
+        if SUI_ACCESS.degraded or stale:
+            # The index may be missing recent payments; ask the client to retry later instead of paying again
+            log.debug("[purchase_token] No payment and the index is not keeping up. Returning 503.")
+            raise JSONRPCError(-32002, 'Sui network unavailable', 503)
+        log.debug("[purchase_token] Payment not received. Returning 402.")
+        raise JSONRPCError(-32001, 'Payment not received', 402) # Payment Required
+
+    log.info("[purchase_token] Claimed payment %s. Generating token.", payment.digest,
+             extra={'digest': payment.digest, 'sender': payment.sender, 'amount': payment.amount})
+    return issue_token()
+
+def require_purchases():
+    if not PURCHASES_ENABLED:
+        raise JSONRPCError(-32006, 'Purchases are not available in prefork mode', 501)
+
+@REGISTRY.method('request_purchase')
+def rpc_request_purchase(ctx, sender: str = None, digest: str = None):
+    """Start an asynchronous purchase; the token is delivered via purchase_status or SSE."""
+    require_purchases()
+    purchase = PURCHASES.create(sender=sender, digest=digest)
+    if purchase is None:
+        raise JSONRPCError(-32003, 'Too many pending purchases', 503)
+    log.debug("[request_purchase] Purchase %s is %s", purchase.purchase_id, purchase.status)
+    result = purchase.as_dict()
+    result['pay_to'] = SUI_ADDRESS_TO_MONITOR
+    result['events'] = PURCHASE_EVENTS_PATH.format(purchase.purchase_id)
+    return result
+
+@REGISTRY.method('purchase_status')
+async def rpc_purchase_status(ctx, purchase_id: str, wait=0):
+    """Report a purchase, first waiting up to `wait` seconds while it is still pending."""
+    require_purchases()
+    if isinstance(wait, bool) or not isinstance(wait, (int, float)) or wait < 0:
+        raise JSONRPCError(-32602, 'Invalid params: wait must be a non-negative number')
+    purchase = PURCHASES.get(purchase_id)
+    if purchase is None:
+        raise JSONRPCError(-32004, 'Unknown purchase', 404)
+    return (await PURCHASES.wait_async(purchase, min(wait, LONG_POLL_MAX_SECONDS))).as_dict()
+
+# get_time and echo have always ignored surplus positional params, and clients send them
+@REGISTRY.method('get_time', auth=True)
+def rpc_get_time(ctx, *ignored):
+    return formatdate(timeval=None, localtime=False, usegmt=True)
+
+@REGISTRY.method('echo', auth=True)
+def rpc_echo(ctx, message=None, *ignored):
+    if message is None:
+        return "Dear User"
+    return f"Dear User, {message}"
+
+def handle_rpc_request(json_request, validator=None, client=None, defer=False):
+    """Dispatch one decoded JSON-RPC request object and return (http_status, response_data)."""
+    # Log records emitted while handling this request carry its JSON-RPC id
+    rpc_id = json_request.get('id') if isinstance(json_request, dict) else None
+    context_token = server_logging.set_request_id(rpc_id)
+    try:
+        outcome = REGISTRY.dispatch(json_request, validator or TOKEN_VALIDATOR, client, defer)
+    finally:
+        server_logging.reset_request_id(context_token)
+    if inspect.isawaitable(outcome):
+        return _with_request_id(rpc_id, outcome)
+    return outcome
+
+async def _with_request_id(rpc_id, outcome):
+    context_token = server_logging.set_request_id(rpc_id)
+    try:
+        return await outcome
+    finally:
+        server_logging.reset_request_id(context_token)
+
+def handle_http_request(command, path, body, client=None, defer=False):
+    """Transport-neutral request entry point shared by every serving engine.
+
+    `client` is the peer IP address, used for rate limiting. Returns
+    (http_status, headers, payload), where payload is bytes or, for event
+    streams, an iterable of byte chunks (see server_engines.serve_asyncio).
+    With defer=True (the asyncio engine), a call to a coroutine method such as
+    a purchase_status long-poll returns an awaitable of that triple instead,
+    so the wait parks on the event loop rather than a thread.
+    """
+    METRICS.inc('http_requests_started_total')
+    started = time.perf_counter()
+    response = route_http_request(command, path, body, client, defer)
+    if inspect.isawaitable(response):
+        return _observed_http_request(command, response, started)
+    _observe_http_request(command, response[0], started)
+    return response
+
+async def _observed_http_request(command, response, started):
+    response = await response
+    _observe_http_request(command, response[0], started)
+    return response
+
+def _observe_http_request(command, status, started):
+    labels = (('command', command), ('status', status))
+    METRICS.inc('http_requests_total', labels)
+    METRICS.observe('http_request_duration_seconds', time.perf_counter() - started, labels)
+
+def route_http_request(command, path, body, client=None, defer=False):
+    retry_after = RATE_LIMITER.check(HTTP_RATE_TIER, client) if client else 0.0
+    if retry_after:
+        METRICS.inc('rate_limited_total', (('scope', 'ip'),))
+        response_data = {
+            'jsonrpc': '2.0',
+            'error': {'code': -32005, 'message': 'Rate limit exceeded', 'data': {'retry_after': round(retry_after, 3)}},
+            'id': None
+        }
+        return 429, rate_limited_headers(retry_after), rpc_codec.encode_response(response_data)
+    if command == 'GET' and path.split('?', 1)[0] == METRICS_PATH:
+        return 200, [('Content-type', METRICS_CONTENT_TYPE)], METRICS.render().encode('utf-8')
+    if command == 'GET' and path.startswith('/purchases/'):
+        return purchase_events(path.split('?', 1)[0])
+    if command == 'POST':
+        outcome = handle_rpc_payload(body, client, defer)
+        if inspect.isawaitable(outcome):
+            return _encoded_rpc_response(outcome)
+        return encode_rpc_response(*outcome)
+    return 405, [('Allow', 'POST')], b'Method Not Allowed. Please use POST for JSON RPC calls.'
+
+def encode_rpc_response(status, response_data):
+    """(http_status, headers, body) for the outcome of handle_rpc_payload()."""
+    if response_data is None:
+        return status, [], b''
+    headers = JSON_HEADERS
+    if status == 429:
+        headers = rate_limited_headers(response_data['error']['data']['retry_after'])
+    return status, headers, rpc_codec.encode_response(response_data)
+
+async def _encoded_rpc_response(outcome):
+    return encode_rpc_response(*await outcome)
+
+def rate_limited_headers(retry_after):
+    return JSON_HEADERS + (('Retry-After', str(math.ceil(retry_after))),)
+
+def purchase_events(path):
+    if not PURCHASES_ENABLED:
+        return 501, [], b'Purchases are not available in prefork mode'
+    prefix, _, suffix = PURCHASE_EVENTS_PATH.partition('{}')
+    purchase_id = path[len(prefix):-len(suffix)] if path.startswith(prefix) and path.endswith(suffix) else None
+    purchase = PURCHASES.get(purchase_id) if purchase_id else None
+    if purchase is None:
+        return 404, [], b'Unknown purchase'
+    headers = [('Content-type', 'text/event-stream'), ('Cache-Control', 'no-cache')]
+    return 200, headers, PURCHASES.events(purchase)
+
+class JSONRPCRequestHandler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests; pipelined requests are
+    # read from the buffered rfile and answered in order
+    protocol_version = 'HTTP/1.1'
+    # Idle keep-alive connections are closed after this many seconds
+    timeout = server_engines.IDLE_TIMEOUT_SECONDS
+
+    def handle(self):
+        self.requests_served = 0
+        super().handle()
+
+    def do_POST(self):
+        post_data = self._read_body()
+        if post_data is not None:
+            self._send(*handle_http_request('POST', self.path, post_data, self.client_address[0]))
 
     def do_GET(self):
-        self.send_response(405)
-        self.send_header('Allow', 'POST')
+        # A GET body is read too, so it can't be mistaken for the next request
+        if self._read_body() is not None:
+            self._send(*handle_http_request('GET', self.path, b'', self.client_address[0]))
+
+    def _read_body(self):
+        """The request body, or None once the request has been refused and the connection marked to close."""
+        refusal, content_length = server_engines.request_body_length(
+            self.headers.get('Transfer-Encoding'), self.headers.get_all('Content-Length', []))
+        if refusal:
+            self.close_connection = True
+            self._send(refusal, [], b'')
+            return None
+        return self.rfile.read(content_length)
+
+    def log_message(self, format, *args):
+        # Access log at debug level; formatted lazily by the log writer thread
+        log.debug('%s - ' + format, self.address_string(), *args)
+
+    def log_error(self, format, *args):
+        log.warning('%s - ' + format, self.address_string(), *args)
+
+    def _send(self, status, headers, payload):
+        self.requests_served += 1
+        if self.requests_served >= server_engines.MAX_REQUESTS_PER_CONNECTION:
+            self.close_connection = True
+        if isinstance(payload, bytes):
+            self.log_request(status)
+            # Status line, headers and body leave in a single write, rather than stalling
+            # on Nagle and delayed ACKs between a header write and a body write
+            headers = [('Server', self.version_string()), ('Date', self.date_time_string()), *headers]
+            self.wfile.write(server_engines.encode_response(status, headers, payload, not self.close_connection))
+            return
+        # A streamed body ends when the connection closes
+        self.close_connection = True
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Connection', 'close')
         self.end_headers()
-        self.wfile.write(b'Method Not Allowed. Please use POST for JSON RPC calls.')
+        try:
+            for chunk in payload:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
 
 if __name__ == '__main__':
-    with socketserver.TCPServer((HOST, PORT), JSONRPCRequestHandler) as httpd:
-        print(f'Serving JSON RPC on {HOST}:{PORT}...') 
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print('\nShutting down server...')
-            httpd.server_close()
+    parser = argparse.ArgumentParser(description='JSON-RPC server with JWT authentication')
+    parser.add_argument('--mode', choices=server_engines.SERVER_MODES, default=SERVER_MODE,
+                        help='serving engine (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='worker processes for --mode prefork (default: one per core)')
+    parser.add_argument('--log-level', choices=server_logging.LOG_LEVELS, default=LOG_LEVEL,
+                        help='log level (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=PORT, help='listen port (default: %(default)s)')
+    parser.add_argument('--sui-rpc-url', default=SUI_RPC_URL,
+                        help='Sui fullnode JSON-RPC URL, e.g. a local fake_sui_node.py (default: %(default)s)')
+    parser.add_argument('--no-rate-limit', action='store_true',
+                        help='disable rate limiting, e.g. for load tests from a single address')
+    args = parser.parse_args()
+    server_logging.configure_logging(args.log_level)
+    # No client has connected yet, so the pool simply picks up the new URL
+    SUI_ACCESS.rpc_url = args.sui_rpc_url
+    if args.no_rate_limit:
+        RATE_LIMITER = RateLimiter({})
+
+    if 'SECRET_KEY' not in CONFIG_OVERRIDES:
+        log.warning("Signing tokens with the built-in SECRET_KEY; set %sSECRET_KEY.", server_config.ENV_PREFIX)
+    if args.mode == 'prefork' and TOKEN_STORE_BACKEND == 'memory':
+        # Each worker would keep its own ledger, so one payment could be claimed once per worker
+        parser.error("--mode prefork needs TOKEN_STORE_BACKEND = 'sqlite' (e.g. MCP_TOKEN_STORE_BACKEND=sqlite): "
+                     "the 'memory' backend keeps tokens and claimed payments per process.")
+    # Not ready until the indexer has synced in this run
+    PAYMENT_LEDGER.reset_synced()
 
+    if args.mode == 'prefork':
+        PURCHASES_ENABLED = False
+        # Import pysui once in the parent, so workers start (and respawn) with it loaded
+        load_pysui()
+        server_engines.serve_prefork(HOST, args.port, JSONRPCRequestHandler, workers=args.workers,
+                                     on_start=start_background_services)
+    elif args.mode == 'asyncio':
+        server_engines.serve_asyncio(HOST, args.port, functools.partial(handle_http_request, defer=True),
+                                     on_start=start_background_services)
+    else:
+        server_engines.serve_threaded(HOST, args.port, JSONRPCRequestHandler, on_start=start_background_services)
@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """Collapses concurrent calls of `func` into one execution.
+
+    Callers arriving while a call is running wait for it and get its result
+    (or its exception). A successful result is also reused by callers arriving
+    within `max_age` seconds after it finished; failures are never reused.
+    """
+
+    def __init__(self, func, clock=time.monotonic):
+        self.func = func
+        self.clock = clock
+        self.executions = 0
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._last = None
+        self._last_at = None
+
+    @property
+    def last_completed(self):
+        """clock() when the last successful execution finished, or None."""
+        return self._last_at
+
+    def __call__(self, max_age=0.0):
+        with self._lock:
+            if self._last is not None and self.clock() - self._last_at < max_age:
+                return self._last.value
+            call = self._inflight
+            leader = call is None
+            if leader:
+                call = self._inflight = _Call()
+                self.executions += 1
+        if not leader:
+            call.done.wait()
+            return call.result()
+        try:
+            call.value = self.func()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                self._inflight = None
+                if call.error is None:
+                    self._last, self._last_at = call, self.clock()
+            call.done.set()
+        return call.result()
@@ -0,0 +1,193 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Most clients (each with its own HTTP connection pool) kept per process
+POOL_SIZE = 4
+# Default deadline for one execute() call, retries included
+CALL_TIMEOUT_SECONDS = 10.0
+# Extra attempts after a transport failure, with full-jitter exponential backoff
+RETRIES = 2
+RETRY_BACKOFF_SECONDS = 0.25
+# Consecutive transport failures that open the circuit, and how long it stays open
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT_SECONDS = 30.0
+
+# pysui takes most of the server's import time, so it is imported on first use (see load_pysui)
+
+# Prefixes pysui puts on results when the request never got a JSON-RPC answer
+_TRANSPORT_ERRORS = ('HTTPX error', 'JSON Decoder Error')
+
+
+def load_pysui():
+    """Import the pysui modules used by SuiAccess and sui_indexer.
+
+    Happens on the first fullnode call anyway; call this up front to pay for it
+    once, e.g. in a prefork parent so forked workers inherit the loaded modules.
+    """
+    import pysui  # noqa: F401
+    import pysui.sui.sui_builders.get_builders  # noqa: F401
+    import pysui.sui.sui_types.collections  # noqa: F401
+    import pysui.sui.sui_types.transaction_filter  # noqa: F401
+
+
+class SuiUnavailableError(Exception):
+    """The fullnode could not be reached, or the circuit breaker is open."""
+
+
+class CircuitOpenError(SuiUnavailableError):
+    """Raised without calling the fullnode while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out now. While half-open only a single probe is let through."""
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        if self.state != self.CLOSED or self._failures:
+            with self._lock:
+                if self.state != self.CLOSED:
+                    log.info("[sui_access] Fullnode reachable again; circuit closed")
+                self.state = self.CLOSED
+                self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    log.warning("[sui_access] Circuit opened after %d consecutive failures", self._failures)
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+
+class SuiAccess:
+    """Pooled, fault-tolerant access to one Sui fullnode.
+
+    Clients are created on first use (so the server starts without the
+    fullnode) and checked out exclusively per call, up to POOL_SIZE at once.
+    Each call gets a deadline that bounds the HTTP timeout, transport failures
+    are retried with jittered backoff, and a client that failed is discarded so
+    the next call reconnects. Repeated failures open the circuit breaker, after
+    which execute() raises SuiUnavailableError immediately until a probe call
+    succeeds. JSON-RPC errors returned by the node are passed back unchanged.
+    """
+
+    def __init__(self, rpc_url, pool_size=POOL_SIZE, call_timeout=CALL_TIMEOUT_SECONDS, retries=RETRIES,
+                 backoff=RETRY_BACKOFF_SECONDS, breaker=None, client_factory=None):
+        self.rpc_url = rpc_url
+        self.pool_size = pool_size
+        self.call_timeout = call_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.client_factory = client_factory or self._create_client
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    @property
+    def degraded(self):
+        """True while the circuit breaker is not closed."""
+        return self.breaker.state != CircuitBreaker.CLOSED
+
+    def _create_client(self):
+        from pysui import SuiConfig, SyncClient
+        client = SyncClient(SuiConfig.user_config(rpc_url=self.rpc_url))
+        log.info("[sui_access] Connected to %s", self.rpc_url)
+        return client
+
+    def execute(self, builder, timeout=None):
+        """Run a pysui builder; returns its SuiRpcResult or raises SuiUnavailableError."""
+        deadline = time.monotonic() + (timeout or self.call_timeout)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = random.uniform(0, self.backoff * (2 ** (attempt - 1)))
+                if time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+            if not self.breaker.allow():
+                raise CircuitOpenError('Sui fullnode unavailable (circuit open)')
+            result, error = self._attempt(builder, deadline)
+            if error is None:
+                self.breaker.record_success()
+                return result
+            self.breaker.record_failure()
+            log.debug("[sui_access] Attempt %d failed: %s", attempt + 1, error)
+        raise SuiUnavailableError(f'Sui fullnode unavailable: {error or "deadline exceeded"}')
+
+    def _attempt(self, builder, deadline):
+        """One call on a pooled client; returns (result, None) or (None, transport error)."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not self._slots.acquire(timeout=remaining):
+            return None, 'no pooled client within the deadline'
+        try:
+            return self._call(builder, deadline)
+        finally:
+            self._slots.release()
+
+    def _call(self, builder, deadline):
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                client = self.client_factory()
+            except Exception as e:
+                return None, f'connect failed: {e.__class__.__name__}: {e}'
+        http = getattr(client, '_client', None)
+        if http is not None:
+            # pysui hardcodes a 120s httpx timeout; bound it by what is left of the deadline
+            http.timeout = max(deadline - time.monotonic(), 0.001)
+        try:
+            result = client.execute(builder)
+        except Exception as e:
+            self._discard(client)
+            return None, f'{e.__class__.__name__}: {e}'
+        if result.is_err() and isinstance(result.result_string, str) \
+                and result.result_string.startswith(_TRANSPORT_ERRORS):
+            # Drop the client so the next call reconnects
+            self._discard(client)
+            return None, result.result_string
+        self._idle.put(client)
+        return result, None
+
+    @staticmethod
+    def _discard(client):
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
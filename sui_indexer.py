@@ -0,0 +1,229 @@
+import logging
+import os
+import threading
+import time
+from metrics import METRICS
+from sui_access import SuiUnavailableError, CircuitOpenError
+from single_flight import SingleFlight
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): every indexer leads
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# Seconds between polls of the fullnode
+POLL_INTERVAL_SECONDS = 2.0
+# Page size for QueryTransactions; also the size of the initial backfill
+PAGE_LIMIT = 50
+# GetMultipleTx accepts at most 50 digests per call
+MULTI_GET_LIMIT = 50
+# A sync that finished less than this many seconds ago is reused by refresh()
+FRESHNESS_SECONDS = 0.5
+SUI_COIN_TYPE = '0x2::sui::SUI'
+# Only the timestamp and balance changes (payer/amount) are needed from GetMultipleTx
+TX_OPTIONS = {
+    'showInput': False,
+    'showRawInput': False,
+    'showEffects': False,
+    'showEvents': False,
+    'showObjectChanges': False,
+    'showBalanceChanges': True,
+}
+
+
+class SuiPaymentIndexer:
+    """Follows incoming transactions of one address in a background thread.
+
+    The first sync backfills the most recent PAGE_LIMIT transactions; after that
+    the QueryTransactions cursor is followed in ascending order so every poll only
+    fetches pages that appeared since the previous one. The indexer keeps no
+    index of its own: payments go to `on_payment`, normally into the payment
+    ledger, which is where claims look them up.
+
+    `on_payment(digest, timestamp_ms, sender, amount, backfill)` is called for
+    each transaction fetched; `amount` is the SUI (in MIST) credited to the
+    address and `sender` the address it was debited from, when known.
+    Digests for which `is_known(digest)` is true (e.g. already in the ledger)
+    are not fetched again.
+
+    `sui_client` is anything with pysui's execute(builder), normally a SuiAccess.
+
+    Syncs run through refresh(), which lets at most one sync run at a time:
+    concurrent callers (the poller and any request that needs fresh data) share
+    the running sync, and one that finished within `freshness` seconds is
+    reused. `on_sync()` is called after every completed sync; a sync that
+    fails raises instead.
+
+    With `lock_path`, only the indexer holding an exclusive flock on that file
+    syncs, so processes sharing a payment store run one poller per host. The
+    others retry the lock every poll, taking over when the leader exits.
+    """
+
+    def __init__(self, sui_client, address, poll_interval=POLL_INTERVAL_SECONDS, on_payment=None,
+                 freshness=FRESHNESS_SECONDS, on_sync=None, lock_path=None, is_known=None):
+        self.sui_client = sui_client
+        self.address = address
+        self.poll_interval = poll_interval
+        self.on_payment = on_payment
+        self.freshness = freshness
+        self.on_sync = on_sync
+        self.lock_path = lock_path
+        self.is_known = is_known
+        self._lock_file = None
+        self._sync = SingleFlight(self.sync_once)
+        self._cursor = None
+        self._synced = False    # True once the initial backfill has completed
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sui-indexer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the flock for the next leader
+            self._lock_file = None
+
+    @property
+    def leader(self):
+        """True if this indexer syncs: it holds the lock, or needs none."""
+        return self.lock_path is None or fcntl is None or self._lock_file is not None
+
+    def try_lead(self):
+        """Take the indexer lock if it is free. Returns self.leader."""
+        if self.leader:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        log.info("[sui_indexer] Process %d is indexing payments for this host", os.getpid())
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.try_lead():
+                    self.refresh()
+            except CircuitOpenError as e:
+                # The breaker already logged the outage
+                log.debug("[sui_indexer] Sync skipped: %s", e)
+            except SuiUnavailableError as e:
+                log.warning("[sui_indexer] Sync skipped: %s", e)
+            except Exception:
+                log.exception("[sui_indexer] Exception during sync")
+            self._stop.wait(self.poll_interval)
+
+    def refresh(self, max_age=None):
+        """Bring the index up to date, sharing a running or recent (max_age seconds) sync.
+
+        Does nothing unless this indexer is the leader.
+        """
+        if self.leader:
+            self._sync(self.freshness if max_age is None else max_age)
+
+    def sync_once(self):
+        """Fetch transactions that arrived since the last sync and index them.
+
+        Not safe to run concurrently with itself; use refresh() from other threads.
+        """
+        if not self._synced:
+            # Initial backfill: newest page only, then follow forward from its head
+            page = self._query_page(cursor=None, descending=True)
+            digests = [tx.digest for tx in page.data if getattr(tx, 'digest', None)]
+            self._ingest(digests[::-1], backfill=True)  # oldest first
+            if digests:
+                self._cursor = digests[0]
+            self._synced = True
+            log.info("[sui_indexer] Initial sync complete: %d transactions backfilled for %s", len(digests), self.address)
+        else:
+            while True:
+                page = self._query_page(cursor=self._cursor, descending=False)
+                digests = [tx.digest for tx in page.data if getattr(tx, 'digest', None)]
+                log.debug("[sui_indexer] Page after cursor %s: %d digests", self._cursor, len(digests))
+                self._ingest(digests)
+                if digests:
+                    self._cursor = page.next_cursor or digests[-1]
+                if not page.has_next_page or not digests:
+                    break
+        if self.on_sync:
+            self.on_sync()
+
+    def _query_page(self, cursor, descending):
+        # pysui is imported on first use (see sui_access.load_pysui)
+        from pysui.sui.sui_builders.get_builders import QueryTransactions
+        from pysui.sui.sui_types.transaction_filter import ToAddressQuery
+        builder = QueryTransactions(
+            query=ToAddressQuery(address=self.address),
+            cursor=cursor,
+            limit=PAGE_LIMIT,
+            descending_order=descending
+        )
+        # pysui treats a falsy descending_order as "use the default", and that default
+        # leaks from the previous builder, so set the flag explicitly
+        builder.descending_order = descending
+        result = self._execute('query_transactions', builder)
+        if not result.is_ok() or result.result_data is None:
+            # Raise so the sync counts as failed and refresh() callers don't reuse it
+            raise RuntimeError(f"QueryTransactions failed: {result.result_string}")
+        return result.result_data
+
+    def _execute(self, phase, builder):
+        """Run one fullnode call, recording its latency and outcome under `phase`."""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = self.sui_client.execute(builder)
+            outcome = 'ok' if result.is_ok() else 'error'
+            return result
+        except SuiUnavailableError:
+            outcome = 'unavailable'
+            raise
+        except Exception:
+            outcome = 'exception'
+            raise
+        finally:
+            METRICS.observe('sui_rpc_duration_seconds', time.perf_counter() - started, (('phase', phase),))
+            METRICS.inc('sui_rpc_requests_total', (('phase', phase), ('outcome', outcome)))
+
+    def _ingest(self, digests, backfill=False):
+        from pysui.sui.sui_builders.get_builders import GetMultipleTx
+        from pysui.sui.sui_types.collections import SuiArray
+        from pysui.sui.sui_types.scalars import SuiString
+        new_digests = [d for d in digests if not self.is_known(d)] if self.is_known else digests
+        for start in range(0, len(new_digests), MULTI_GET_LIMIT):
+            chunk = new_digests[start:start + MULTI_GET_LIMIT]
+            builder = GetMultipleTx(digests=SuiArray([SuiString(d) for d in chunk]), options=TX_OPTIONS)
+            result = self._execute('multi_get_transactions', builder)
+            if not result.is_ok():
+                # Leave the cursor where it is so the page is retried on the next poll
+                raise RuntimeError(f"GetMultipleTx failed: {result.result_string}")
+            for tx_block in getattr(result.result_data, 'transactions', None) or []:
+                timestamp_ms = int(tx_block.timestamp_ms or 0)
+                if self.on_payment:
+                    sender, amount = self._payment_details(tx_block)
+                    self.on_payment(tx_block.digest, timestamp_ms, sender, amount, backfill)
+
+    def _payment_details(self, tx_block):
+        """Return (sender, amount) from the SUI balance changes of a transaction."""
+        sender = None
+        amount = 0
+        for change in tx_block.balance_changes or []:
+            if change.get('coinType') != SUI_COIN_TYPE:
+                continue
+            owner = change.get('owner')
+            owner = owner.get('AddressOwner') if isinstance(owner, dict) else None
+            delta = int(change.get('amount', 0))
+            if owner == self.address and delta > 0:
+                amount += delta
+            elif delta < 0 and sender is None:
+                sender = owner
+        return sender, amount
@@ -0,0 +1,115 @@
+import threading
+import time
+import pytest
+from bench_server import percentile
+from fake_sui_node import FakeSuiNode, PaymentStream, start_fake_node
+from sui_access import SuiAccess, SuiUnavailableError, CircuitBreaker
+from payment_ledger import PaymentLedger
+from sui_indexer import SuiPaymentIndexer
+
+ADDRESS = '0x' + 'a' * 64
+
+
+@pytest.fixture
+def fake_node():
+    node = FakeSuiNode(PaymentStream(rate=0, backfill=3, seed=1))
+    server = start_fake_node(node)
+    yield node, f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def indexer_with_ledger(url, **kwargs):
+    ledger = PaymentLedger()
+    payments = []
+
+    def on_payment(digest, timestamp_ms, sender, amount, backfill):
+        payments.append((digest, timestamp_ms, sender, amount, backfill))
+        ledger.record(digest, timestamp_ms, sender=sender, amount=amount, consumed=backfill)
+    indexer = SuiPaymentIndexer(SuiAccess(url), ADDRESS, on_payment=on_payment,
+                                is_known=lambda digest: digest in ledger, **kwargs)
+    return indexer, ledger, payments
+
+
+def test_indexer_follows_fake_node(fake_node):
+    node, url = fake_node
+    indexer, ledger, payments = indexer_with_ledger(url)
+    indexer.sync_once()
+    assert len(payments) == 3 and all(backfill for *_, backfill in payments)
+    assert len(ledger) == 3 and ledger.claim(0) is None
+
+    digest = node.stream.add(sender='0xpayer', amount=5)
+    indexer.sync_once()
+    assert payments[-1][0] == digest
+    assert payments[-1][2:] == ('0xpayer', 5, False)
+    assert ledger.claim(int(time.time() * 1000) - 5000, sender='0xpayer').digest == digest
+
+
+def test_unreachable_node_opens_circuit(fake_node):
+    node, url = fake_node
+    node.error_rate = 1.0
+    access = SuiAccess(url, retries=1, backoff=0, breaker=CircuitBreaker(failure_threshold=2))
+    synced = []
+    indexer = SuiPaymentIndexer(access, ADDRESS, on_sync=lambda: synced.append(True))
+    with pytest.raises(SuiUnavailableError):
+        indexer.sync_once()
+    assert access.degraded and not synced
+
+
+class FailingResult:
+    result_data = None
+    result_string = 'node error'
+
+    def is_ok(self):
+        return False
+
+
+class FailingClient:
+    def execute(self, builder):
+        return FailingResult()
+
+
+def test_failed_query_is_not_a_fresh_sync():
+    synced = []
+    indexer = SuiPaymentIndexer(FailingClient(), ADDRESS, freshness=60, on_sync=lambda: synced.append(True))
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match='QueryTransactions failed'):
+            indexer.refresh()
+    assert indexer._sync.executions == 2 and not synced
+
+
+def test_percentile_nearest_rank():
+    samples = list(range(1, 1001))
+    assert percentile(samples, 0.5) == 500
+    assert percentile(samples, 0.99) == 990
+    assert percentile(samples, 0.999) == 999
+    assert percentile([], 0.5) == 0.0
+
+
+def test_refresh_coalesces_concurrent_syncs(fake_node):
+    node, url = fake_node
+    node.latency_ms = 50
+    indexer, ledger, _ = indexer_with_ledger(url, freshness=1.0)
+    indexer.refresh()
+    node.stream.add()
+    queries = node.calls['suix_queryTransactionBlocks']
+    threads = [threading.Thread(target=indexer.refresh, kwargs={'max_age': 0}) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One sync for the whole burst (possibly plus one that started after it finished)
+    assert node.calls['suix_queryTransactionBlocks'] - queries <= 2
+    assert len(ledger) == 4
+
+
+def test_one_indexer_leads_per_lock_file(tmp_path):
+    lock_path = str(tmp_path / 'indexer.lock')
+    first = SuiPaymentIndexer(None, ADDRESS, lock_path=lock_path)
+    second = SuiPaymentIndexer(None, ADDRESS, lock_path=lock_path)
+    assert first.try_lead() and first.leader
+    assert not second.try_lead() and not second.leader
+    second.refresh()  # a follower never syncs
+    first.stop()
+    assert second.try_lead()
+    second.stop()
@@ -0,0 +1,58 @@
+import threading
+from metrics import MetricsRegistry
+
+
+def test_counters_from_many_threads_are_merged():
+    metrics = MetricsRegistry()
+
+    def work():
+        for _ in range(1000):
+            metrics.inc('calls_total', (('method', 'echo'),))
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.counter_value('calls_total', (('method', 'echo'),)) == 8000
+
+
+def test_finished_threads_keep_their_counts_after_retirement():
+    metrics = MetricsRegistry()
+    for _ in range(200):
+        thread = threading.Thread(target=metrics.inc, args=('calls_total',))
+        thread.start()
+        thread.join()
+    assert metrics.counter_value('calls_total') == 200
+    assert len(metrics._shards) < 200
+
+
+def test_render_histogram_and_gauge():
+    metrics = MetricsRegistry(buckets=(0.1, 1.0))
+    metrics.describe('latency_seconds', 'histogram', 'Latency.')
+    metrics.observe('latency_seconds', 0.05, (('method', 'get_time'),))
+    metrics.observe('latency_seconds', 0.5, (('method', 'get_time'),))
+    metrics.observe('latency_seconds', 5.0, (('method', 'get_time'),))
+    metrics.gauge('queue_size', 'Queue size.', lambda: 3)
+    text = metrics.render()
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{method="get_time",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{method="get_time",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{method="get_time",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{method="get_time"} 3' in text
+    assert 'latency_seconds_sum{method="get_time"} 5.55' in text
+    assert '# TYPE queue_size gauge\nqueue_size 3' in text
+
+
+def test_counter_read_from_its_owner():
+    metrics = MetricsRegistry()
+    counts = {'hit': 0, 'miss': 0}
+    metrics.counter('lookups_total', 'Lookups.', lambda: {(('result', r),): n for r, n in counts.items()})
+    counts['hit'] += 2
+    text = metrics.render()
+    assert '# TYPE lookups_total counter' in text
+    assert 'lookups_total{result="hit"} 2' in text and 'lookups_total{result="miss"} 0' in text
+
+def test_label_values_are_escaped():
+    metrics = MetricsRegistry()
+    metrics.inc('calls_total', (('method', 'a"b\\c'),))
+    assert 'calls_total{method="a\\"b\\\\c"} 1' in metrics.render()
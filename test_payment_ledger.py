@@ -0,0 +1,139 @@
+import multiprocessing
+import threading
+import time
+from payment_ledger import PaymentLedger, SQLitePaymentLedger
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def test_each_payment_backs_one_claim():
+    ledger = PaymentLedger()
+    ledger.record('d1', now_ms())
+    assert ledger.claim(now_ms() - 10000).digest == 'd1'
+    assert ledger.claim(now_ms() - 10000) is None
+
+
+def test_claims_oldest_payment_inside_window():
+    ledger = PaymentLedger()
+    t = now_ms()
+    ledger.record('old', t - 60000)
+    ledger.record('a', t - 5000)
+    ledger.record('b', t - 1000)
+    assert ledger.claim(t - 10000).digest == 'a'
+    assert ledger.claim(t - 10000).digest == 'b'
+    assert ledger.claim(t - 10000) is None
+
+
+def test_claim_by_digest_and_sender():
+    ledger = PaymentLedger()
+    t = now_ms()
+    ledger.record('d1', t, sender='0xalice', amount=5)
+    ledger.record('d2', t, sender='0xbob', amount=50)
+    assert ledger.claim(t - 1000, digest='d2', sender='0xalice') is None
+    assert ledger.claim(t - 1000, sender='0xbob').digest == 'd2'
+    assert ledger.claim(t - 1000, digest='d2') is None
+    assert ledger.claim(t - 1000, min_amount=10) is None
+    assert ledger.claim(t - 1000, digest='d1').digest == 'd1'
+
+
+def test_consumed_payments_are_not_claimable():
+    ledger = PaymentLedger()
+    ledger.record('d1', now_ms(), consumed=True)
+    assert ledger.claim(now_ms() - 1000) is None
+    assert ledger.claim(now_ms() - 1000, digest='d1') is None
+
+
+def test_prune_expires_entries_and_refuses_stale_records():
+    ledger = PaymentLedger(retention_ms=1000)
+    t = now_ms()
+    ledger.record('d1', t - 500, sender='0xalice')
+    assert ledger.prune(t + 1000) == 1
+    assert len(ledger) == 0
+    assert not ledger.record('d0', t - 5000)
+
+
+def test_concurrent_claims_never_share_a_payment():
+    ledger = PaymentLedger()
+    t = now_ms()
+    for i in range(50):
+        ledger.record(f'd{i}', t)
+    claimed = []
+
+    def worker():
+        for _ in range(20):
+            payment = ledger.claim(t - 1000)
+            if payment:
+                claimed.append(payment.digest)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(f'd{i}' for i in range(50))
+
+
+def test_sqlite_ledger_claims_and_survives_reopening(tmp_path):
+    path = str(tmp_path / 'state.db')
+    ledger = SQLitePaymentLedger(path)
+    t = now_ms()
+    assert ledger.record('d1', t - 2000, sender='0xalice', amount=5)
+    assert ledger.record('d2', t - 1000, sender='0xbob', amount=50)
+    assert not ledger.record('d1', t - 2000)
+    assert not ledger.record('ancient', t - 2 * 60 * 60 * 1000)
+    assert ledger.claim(t - 10000, min_amount=10).digest == 'd2'
+    assert ledger.claim(t - 10000, digest='d2') is None
+    ledger.close()
+
+    reopened = SQLitePaymentLedger(path)
+    # A backfill after a restart finds d2 again: it stays consumed, d1 stays claimable
+    assert not reopened.record('d2', t - 1000, consumed=False)
+    assert reopened.claim(t - 10000, sender='0xbob') is None
+    payment = reopened.claim(t - 10000)
+    assert (payment.digest, payment.sender, payment.amount) == ('d1', '0xalice', 5)
+    assert reopened.synced_ms() is None
+    reopened.mark_synced(t)
+    assert reopened.synced_ms() == t
+    reopened.close()
+
+
+def _claim_all(path, since_ms, results):
+    ledger = SQLitePaymentLedger(path)
+    claimed = []
+    while True:
+        payment = ledger.claim(since_ms)
+        if payment is None:
+            break
+        claimed.append(payment.digest)
+    ledger.close()
+    results.put(claimed)
+
+
+def test_sqlite_ledger_payment_backs_one_claim_across_processes(tmp_path):
+    path = str(tmp_path / 'state.db')
+    ledger = SQLitePaymentLedger(path)
+    t = now_ms()
+    for i in range(200):
+        ledger.record(f'd{i}', t)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_claim_all, args=(path, t - 1000, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    claimed = [digest for _ in processes for digest in results.get(timeout=30)]
+    for process in processes:
+        process.join()
+    assert sorted(claimed) == sorted(f'd{i}' for i in range(200))
+
+
+def test_sqlite_ledger_remembers_initialization(tmp_path):
+    path = str(tmp_path / 'state.db')
+    ledger = SQLitePaymentLedger(path)
+    assert not ledger.initialized()
+    ledger.mark_initialized()
+    ledger.reset_synced()
+    ledger.close()
+    assert SQLitePaymentLedger(path).initialized()
+    assert not SQLitePaymentLedger(str(tmp_path / 'other.db')).initialized()
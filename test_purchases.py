@@ -0,0 +1,91 @@
+import asyncio
+import itertools
+import threading
+import time
+from payment_ledger import PaymentLedger
+from purchases import PurchaseBook, COMPLETED, EXPIRED, PENDING
+
+WINDOW_MS = 10 * 60 * 1000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def make_book(**kwargs):
+    ledger = PaymentLedger()
+    tokens = (f'token-{i}' for i in itertools.count())
+    book = PurchaseBook(
+        claim=lambda since_ms, digest, sender: ledger.claim(since_ms, digest=digest, sender=sender),
+        issue=lambda: next(tokens),
+        window_ms=WINDOW_MS,
+        **kwargs
+    )
+    return ledger, book
+
+
+def pay(ledger, book, digest, sender=None):
+    ledger.record(digest, now_ms(), sender=sender, amount=1)
+    return book.offer(digest, now_ms(), sender)
+
+
+def test_payment_already_indexed_completes_immediately():
+    ledger, book = make_book()
+    ledger.record('d1', now_ms(), sender='0xa')
+    purchase = book.create()
+    assert purchase.status == COMPLETED and purchase.payment_digest == 'd1'
+    assert ledger.claim(0) is None
+
+
+def test_payments_match_sender_then_oldest_anonymous():
+    ledger, book = make_book()
+    first = book.create()
+    second = book.create()
+    mine = book.create(sender='0xbuyer')
+    by_digest = book.create(digest='d9')
+
+    assert pay(ledger, book, 'd1', sender='0xbuyer') is mine
+    assert pay(ledger, book, 'd2', sender='0xother') is first
+    assert pay(ledger, book, 'd9', sender='0xother') is by_digest
+    assert pay(ledger, book, 'd3') is second
+    assert pay(ledger, book, 'd4') is None
+    assert ledger.claim(0).digest == 'd4'
+    assert [p.token for p in (mine, first, by_digest, second)] == ['token-0', 'token-1', 'token-2', 'token-3']
+
+
+def test_pending_purchases_expire_and_wake_waiters():
+    ledger, book = make_book(pending_ttl=0.2)
+    purchase = book.create(sender='0xbuyer')
+    started = time.monotonic()
+    assert book.wait(purchase, 5).status == EXPIRED
+    assert time.monotonic() - started < 2
+    assert book.get(purchase.purchase_id) is None
+    assert pay(ledger, book, 'd1', sender='0xbuyer') is None
+
+
+def test_wait_returns_when_matched_from_another_thread():
+    ledger, book = make_book()
+    purchase = book.create()
+    threading.Timer(0.1, pay, args=(ledger, book, 'd1')).start()
+    assert book.wait(purchase, 5).status == COMPLETED
+
+
+def test_wait_async_and_event_stream():
+    ledger, book = make_book()
+    purchase = book.create()
+
+    async def consume():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.1, pay, ledger, book, 'd1')
+        return [chunk async for chunk in book.events(purchase, heartbeat=0.05)]
+    chunks = asyncio.run(consume())
+    assert chunks[0].startswith(b'event: pending')
+    assert b': keep-alive\n\n' in chunks
+    assert chunks[-1].startswith(b'event: completed') and b'token-0' in chunks[-1]
+
+
+def test_book_refuses_purchases_when_full():
+    ledger, book = make_book(max_purchases=2)
+    assert book.create() and book.create()
+    assert book.create() is None
+    assert len(book) == 2 and all(p.status == PENDING for p in book._purchases.values())
@@ -0,0 +1,53 @@
+import base64
+import json
+import pytest
+from rate_limit import RateLimiter, Tier, unverified_token_id
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_lazy_refill():
+    clock = FakeClock()
+    limiter = RateLimiter({'echo': (2.0, 3)}, clock=clock)
+    assert [limiter.check('echo', 'a') for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.check('echo', 'a') == pytest.approx(0.5)
+    assert limiter.check('echo', 'b') == 0.0   # other keys have their own bucket
+    clock.now += 0.5
+    assert limiter.check('echo', 'a') == 0.0
+    assert limiter.check('echo', 'a') > 0
+
+
+def test_tiers_and_default():
+    clock = FakeClock()
+    limiter = RateLimiter({'purchase_token': Tier(1.0, 1), 'open': None}, default=(10.0, 2), clock=clock)
+    assert limiter.check('purchase_token', 'ip') == 0.0
+    assert limiter.check('purchase_token', 'ip') == pytest.approx(1.0)
+    assert limiter.check('get_time', 'ip') == 0.0 and limiter.check('get_time', 'ip') == 0.0
+    assert limiter.check('get_time', 'ip') > 0
+    assert all(limiter.check('open', 'ip') == 0.0 for _ in range(100))
+    assert RateLimiter({}).check('anything', 'ip') == 0.0
+
+
+def test_stale_and_excess_buckets_are_evicted():
+    clock = FakeClock()
+    limiter = RateLimiter({}, default=(1.0, 1), max_keys=3, clock=clock)
+    for key in range(10):
+        limiter.check('m', key)
+    assert len(limiter) == 3
+    clock.now += 2.0
+    limiter.check('m', 'fresh')
+    assert len(limiter) == 1
+
+
+def test_unverified_token_id():
+    payload = base64.urlsafe_b64encode(json.dumps({'token_id': 'abc'}).encode()).rstrip(b'=').decode()
+    assert unverified_token_id(f'e30.{payload}.sig') == 'abc'
+    assert unverified_token_id('not-a-jwt') is None
+    assert unverified_token_id('a.!!!.c') is None
+    assert unverified_token_id(42) is None
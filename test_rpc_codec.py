@@ -0,0 +1,39 @@
+import json
+import pytest
+import rpc_codec
+
+RESPONSES = [
+    {'jsonrpc': '2.0', 'result': 'Sat, 17 Oct 2026 12:00:00 GMT', 'id': 1},
+    {'jsonrpc': '2.0', 'error': {'code': -32601, 'message': 'Method not found'}, 'id': 7},
+    {'jsonrpc': '2.0', 'error': {'code': -32601, 'message': 'Method not found'}, 'id': 'req-é'},
+    {'jsonrpc': '2.0', 'error': {'code': -32700, 'message': 'Parse error'}, 'id': None},
+    {'jsonrpc': '2.0', 'error': {'code': -32005, 'message': 'Rate limit exceeded', 'data': {'retry_after': 0.5}},
+     'id': True},
+    {'jsonrpc': '2.0', 'result': 2 ** 70, 'id': 2},
+]
+
+
+@pytest.fixture(params=rpc_codec.BACKENDS)
+def backend(request):
+    previous = rpc_codec.backend
+    rpc_codec.set_backend(request.param)
+    yield request.param
+    rpc_codec.set_backend(previous)
+
+
+def test_responses_round_trip(backend):
+    for response in RESPONSES:
+        assert json.loads(rpc_codec.encode_response(response)) == response
+    assert json.loads(rpc_codec.encode_response(RESPONSES)) == RESPONSES
+
+
+def test_loads_from_bytes(backend):
+    assert rpc_codec.loads(b'{"method": "echo", "params": ["\xc3\xa9"]}') == {'method': 'echo', 'params': ['é']}
+    for body in (b'', b'{', b'\xff\xfe\xfd', b'{"a": }'):
+        with pytest.raises(ValueError):
+            rpc_codec.loads(body)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        rpc_codec.set_backend('simplejson')
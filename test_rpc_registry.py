@@ -0,0 +1,106 @@
+import asyncio
+import jwt
+import pytest
+from rpc_registry import MethodRegistry, JSONRPCError
+
+
+class StaticValidator:
+    def validate(self, token):
+        if token != 'good':
+            raise jwt.InvalidTokenError('bad token')
+        return 'token-id'
+
+
+@pytest.fixture
+def registry():
+    registry = MethodRegistry()
+
+    @registry.method('add')
+    def add(ctx, a: int, b: int = 0):
+        return a + b
+
+    @registry.method('whoami', auth=True)
+    def whoami(ctx, suffix=''):
+        return ctx.token_id + suffix
+
+    @registry.method('fail')
+    def fail(ctx):
+        raise JSONRPCError(-32001, 'Payment not received', 402)
+
+    @registry.method('slow_add')
+    async def slow_add(ctx, a, b):
+        return a + b
+
+    return registry
+
+
+def call(registry, **request):
+    return registry.dispatch(dict(jsonrpc='2.0', id=1, **request), StaticValidator())
+
+
+def test_positional_and_named_params(registry):
+    assert call(registry, method='add', params=[1, 2])[1]['result'] == 3
+    assert call(registry, method='add', params={'a': 5})[1]['result'] == 5
+    assert call(registry, method='slow_add', params=[2, 3])[1]['result'] == 5
+
+
+@pytest.mark.parametrize('params', [[], [1, 2, 3], {'c': 1}, ['x'], 'nope'])
+def test_invalid_params(registry, params):
+    status, response = call(registry, method='add', params=params)
+    assert status == 400 and response['error']['code'] == -32602
+
+
+def test_token_from_field_or_first_param(registry):
+    assert call(registry, method='whoami', token='good')[1]['result'] == 'token-id'
+    assert call(registry, method='whoami', params=['good', '!'])[1]['result'] == 'token-id!'
+    status, response = call(registry, method='whoami', params=['bad'])
+    assert status == 401 and response['error']['message'] == 'No access: Invalid token'
+    status, response = call(registry, method='whoami')
+    assert status == 401 and response['error']['message'] == 'No access: Missing token'
+
+
+def test_errors_and_observers(registry):
+    seen = []
+    registry.observers.append(lambda method, status, elapsed: seen.append((method, status)))
+    assert call(registry, method='fail') == (402, {'jsonrpc': '2.0', 'error': {'code': -32001, 'message': 'Payment not received'}, 'id': 1})
+    assert call(registry, method='missing')[1]['error']['code'] == -32601
+    assert registry.dispatch([], StaticValidator())[1]['error']['code'] == -32600
+    assert seen == [('fail', 402)]
+    with pytest.raises(ValueError):
+        registry.method('add')(lambda ctx: None)
+
+
+def test_admit_runs_before_token_validation(registry):
+    seen = []
+
+    def admit(ctx, token):
+        seen.append((ctx.method, token, ctx.client))
+        raise JSONRPCError(-32005, 'Rate limit exceeded', 429, data={'retry_after': 1.0})
+    registry.admit = admit
+    status, response = registry.dispatch({'jsonrpc': '2.0', 'method': 'whoami', 'params': ['bad'], 'id': 1},
+                                         StaticValidator(), client='10.0.0.1')
+    assert status == 429 and response['error']['data'] == {'retry_after': 1.0}
+    assert seen == [('whoami', 'bad', '10.0.0.1')]
+
+
+def test_deferred_coroutine_method_is_awaited_by_the_caller(registry):
+    seen = []
+    registry.observers.append(lambda method, status, elapsed: seen.append((method, status)))
+    request = {'jsonrpc': '2.0', 'method': 'slow_add', 'params': [1, 2], 'id': 1}
+    outcome = registry.dispatch(request, StaticValidator(), defer=True)
+    assert seen == []
+    assert asyncio.run(outcome) == (200, {'jsonrpc': '2.0', 'result': 3, 'id': 1})
+    assert seen == [('slow_add', 200)]
+    # Params are still bound before deferring, and plain methods are never deferred
+    assert registry.dispatch({**request, 'params': [1]}, StaticValidator(), defer=True)[0] == 400
+    assert registry.dispatch({**request, 'method': 'add'}, StaticValidator(), defer=True)[1]['result'] == 3
+
+
+def test_var_positional_drops_surplus_params(registry):
+    @registry.method('first')
+    def first(ctx, value=None, *ignored):
+        return value
+
+    assert call(registry, method='first', params=[1, 2, 3])[1]['result'] == 1
+    assert call(registry, method='first', params={'value': 1, 'other': 2})[0] == 400
+    assert call(registry, method='add', params=[1, 2, 3])[1]['error']['code'] == -32602
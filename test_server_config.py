@@ -0,0 +1,77 @@
+import json
+import pytest
+from server_config import load_config, ConfigError, one_of, rate_limit, rate_limits
+
+SETTINGS = {'SECRET_KEY': str, 'PORT': int, 'WORKERS': (int, None), 'CHAIN_FRESHNESS_SECONDS': float,
+            'RATE_LIMIT_PER_IP': (tuple, None)}
+
+
+def test_environment_overrides():
+    environ = {'MCP_SECRET_KEY': 's3cret', 'MCP_PORT': '8081', 'MCP_WORKERS': '4',
+               'MCP_CHAIN_FRESHNESS_SECONDS': '1', 'MCP_RATE_LIMIT_PER_IP': '[5, 10]', 'PORT': '1'}
+    assert load_config(SETTINGS, environ) == {'SECRET_KEY': 's3cret', 'PORT': 8081, 'WORKERS': 4,
+                                              'CHAIN_FRESHNESS_SECONDS': 1, 'RATE_LIMIT_PER_IP': (5, 10)}
+    assert load_config(SETTINGS, {'MCP_RATE_LIMIT_PER_IP': 'null'}) == {'RATE_LIMIT_PER_IP': None}
+    assert load_config(SETTINGS, {}) == {}
+
+
+def test_file_then_environment(tmp_path):
+    path = tmp_path / 'server.json'
+    path.write_text(json.dumps({'PORT': 9000, 'SECRET_KEY': 'from-file'}))
+    environ = {'MCP_CONFIG_FILE': str(path), 'MCP_PORT': '9001'}
+    assert load_config(SETTINGS, environ) == {'PORT': 9001, 'SECRET_KEY': 'from-file'}
+
+
+@pytest.mark.parametrize('environ', [
+    {'MCP_PORT': 'eighty'},
+    {'MCP_PORT': '"8080"'},
+    {'MCP_PORT': '80.5'},
+    {'MCP_WORKERS': '"x"'},
+    {'MCP_WORKERS': 'true'},
+    {'MCP_CHAIN_FRESHNESS_SECONDS': 'null'},
+    {'MCP_RATE_LIMIT_PER_IP': '{"rate": 5}'},
+    {'MCP_CONFIG_FILE': '/nonexistent/server.json'},
+])
+def test_bad_values(environ):
+    with pytest.raises(ConfigError):
+        load_config(SETTINGS, environ)
+
+
+def test_unknown_setting_in_file(tmp_path):
+    path = tmp_path / 'server.json'
+    path.write_text(json.dumps({'PROT': 9000}))
+    with pytest.raises(ConfigError, match='PROT'):
+        load_config(SETTINGS, {'MCP_CONFIG_FILE': str(path)})
+
+
+def test_only_declared_settings_are_read(tmp_path):
+    assert load_config(SETTINGS, {'MCP_JSON_HEADERS': '[]'}) == {}
+    path = tmp_path / 'server.json'
+    path.write_text(json.dumps({'JSON_HEADERS': []}))
+    with pytest.raises(ConfigError, match='JSON_HEADERS'):
+        load_config(SETTINGS, {'MCP_CONFIG_FILE': str(path)})
+
+
+CHECKS = {'MODE': one_of(('threaded', 'asyncio')), 'LIMIT': rate_limit, 'LIMITS': rate_limits}
+CHECKED_SETTINGS = {'MODE': str, 'LIMIT': (tuple, None), 'LIMITS': dict}
+
+
+def test_checks_accept_good_values():
+    environ = {'MCP_MODE': 'asyncio', 'MCP_LIMIT': '[0.5, 2]', 'MCP_LIMITS': '{"echo": [1, 5], "get_time": null}'}
+    assert load_config(CHECKED_SETTINGS, environ, CHECKS) == {
+        'MODE': 'asyncio', 'LIMIT': (0.5, 2), 'LIMITS': {'echo': (1, 5), 'get_time': None}}
+
+
+@pytest.mark.parametrize('environ', [
+    {'MCP_MODE': 'forking'},
+    {'MCP_LIMIT': '[5]'},
+    {'MCP_LIMIT': '[0, 5]'},
+    {'MCP_LIMIT': '[5, 0.5]'},
+    {'MCP_LIMIT': '["5", 10]'},
+    {'MCP_LIMITS': '{"echo": 5}'},
+    {'MCP_LIMITS': '{"echo": [1, 5, 10]}'},
+    {'MCP_LIMITS': '{"echo": [true, 5]}'},
+])
+def test_checks_refuse_bad_values(environ):
+    with pytest.raises(ConfigError):
+        load_config(CHECKED_SETTINGS, environ, CHECKS)
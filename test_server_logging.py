@@ -0,0 +1,125 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import server_engines
+import server_logging
+from server_logging import BatchingWriter, JSONFormatter, _EnqueueHandler
+
+
+def json_logger(name):
+    """A logger writing through its own BatchingWriter; returns (logger, writer, stream)."""
+    stream = io.StringIO()
+    writer = BatchingWriter(stream, JSONFormatter())
+    writer.start()
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [_EnqueueHandler(writer)]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, writer, stream
+
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_formatter_fields():
+    logger, writer, stream = json_logger('test.fields')
+    logger.info('paid %d MIST', 5, extra={'digest': 'abc'})
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logger.exception('failed')
+    writer.stop()
+    paid, failed = lines(stream)
+    assert paid.keys() == {'ts', 'level', 'logger', 'msg', 'digest'}
+    assert (paid['level'], paid['logger'], paid['msg'], paid['digest']) == ('INFO', 'test.fields', 'paid 5 MIST', 'abc')
+    assert failed['level'] == 'ERROR' and 'ValueError: boom' in failed['exc']
+
+
+def test_request_id_follows_threads_and_tasks():
+    logger, writer, stream = json_logger('test.rpc_id')
+
+    def handle(rpc_id):
+        token = server_logging.set_request_id(rpc_id)
+        try:
+            logger.info('thread')
+        finally:
+            server_logging.reset_request_id(token)
+    threads = [threading.Thread(target=handle, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    async def task(rpc_id):
+        server_logging.set_request_id(rpc_id)
+        await asyncio.sleep(0.01)
+        logger.info('task')
+
+    async def main():
+        await asyncio.gather(task('a'), task('b'))
+    asyncio.run(main())
+    logger.info('outside')
+    writer.stop()
+    records = lines(stream)
+    assert sorted(r['rpc_id'] for r in records if r['msg'] == 'thread') == [0, 1, 2, 3]
+    assert sorted(r['rpc_id'] for r in records if r['msg'] == 'task') == ['a', 'b']
+    assert 'rpc_id' not in records[-1]
+
+
+def test_writer_flushes_queued_records_on_stop():
+    logger, writer, stream = json_logger('test.flush')
+    for i in range(server_logging.BATCH_SIZE * 3):
+        logger.debug('record %d', i)
+    writer.stop()
+    assert [r['msg'] for r in lines(stream)] == [f'record {i}' for i in range(server_logging.BATCH_SIZE * 3)]
+
+
+FORK_SCRIPT = '''
+import logging, os, server_logging
+server_logging.configure_logging('INFO')
+log = logging.getLogger('forked')
+log.info('parent before fork')
+pid = os.fork()
+if pid == 0:
+    log.info('child')
+    logging.shutdown()
+    os._exit(0)
+os.waitpid(pid, 0)
+log.info('parent after fork')
+'''
+
+
+def test_writer_restarts_in_forked_children():
+    result = subprocess.run([sys.executable, '-c', FORK_SCRIPT], capture_output=True, text=True, timeout=10,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    messages = [json.loads(line)['msg'] for line in result.stdout.splitlines()]
+    assert sorted(messages) == ['child', 'parent after fork', 'parent before fork']
+
+
+def test_handler_tracebacks_go_to_the_log(caplog):
+    class FailingHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            raise RuntimeError('handler failed')
+
+    server = server_engines.ThreadingJSONRPCServer(('127.0.0.1', 0), FailingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with caplog.at_level(logging.ERROR, logger='server_engines'):
+            with socket.create_connection(server.server_address, timeout=5) as sock:
+                sock.recv(1)  # returns once the handler has failed and the connection is closed
+    finally:
+        server.shutdown()
+        server.server_close()
+    record, = [r for r in caplog.records if r.name == 'server_engines']
+    assert 'Exception while handling a request' in record.getMessage()
+    # The traceback is in exc_info, or already rendered to exc_text by the JSON log handler
+    assert 'RuntimeError: handler failed' in caplog.text
@@ -0,0 +1,494 @@
+import asyncio
+import contextlib
+import functools
+import http.client
+import inspect
+import json
+import multiprocessing
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import server_engines
+import simple_server
+from fake_sui_node import FakeSuiNode, PaymentStream, start_fake_node
+from payment_ledger import PaymentLedger, SQLitePaymentLedger
+from purchases import PurchaseBook
+from rate_limit import RateLimiter
+from sui_access import CircuitBreaker, SuiAccess
+from sui_indexer import SuiPaymentIndexer
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    monkeypatch.setattr(simple_server, 'RATE_LIMITER', RateLimiter({}))
+
+
+@pytest.fixture(autouse=True)
+def fresh_purchases(monkeypatch):
+    # Pending purchases left by one test would otherwise absorb another test's payments
+    book = simple_server.PURCHASES
+    monkeypatch.setattr(simple_server, 'PURCHASES', PurchaseBook(book.claim, book.issue, book.window_ms))
+
+
+@contextlib.contextmanager
+def asyncio_server(app, threads=2):
+    """Serve `app` with the asyncio engine on an ephemeral port; yields the port."""
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=threads)
+    server = loop.run_until_complete(asyncio.start_server(
+        lambda r, w: server_engines._asyncio_connection(r, w, app, executor), '127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def shutdown():
+        server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    try:
+        yield server.sockets[0].getsockname()[1]
+    finally:
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        executor.shutdown()
+
+
+@contextlib.contextmanager
+def threaded_server():
+    """Serve JSONRPCRequestHandler with the threaded engine on an ephemeral port; yields the port."""
+    httpd = server_engines.ThreadingJSONRPCServer(('127.0.0.1', 0), simple_server.JSONRPCRequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield httpd.server_address[1]
+    finally:
+        httpd.shutdown()
+        thread.join()
+        httpd.server_close()
+
+
+@pytest.fixture(params=['threaded', 'asyncio'])
+def engine_port(request):
+    if request.param == 'threaded':
+        server = threaded_server()
+    else:
+        server = asyncio_server(functools.partial(simple_server.handle_http_request, defer=True))
+    with server as port:
+        yield port
+
+
+def rpc(method, params=None, rpc_id=1, **extra):
+    request = {'jsonrpc': '2.0', 'method': method, 'id': rpc_id, **extra}
+    if params is not None:
+        request['params'] = params
+    return json.dumps(request).encode('utf-8')
+
+
+def post(conn, body):
+    conn.request('POST', '/', body, {'Content-Type': 'application/json'})
+
+
+def raw_request(body, headers=()):
+    lines = ['POST / HTTP/1.1', 'Host: test', 'Content-Type: application/json', *headers]
+    if not any(header.lower().startswith(('content-length:', 'transfer-encoding:')) for header in headers):
+        lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii') + body
+
+
+def read_response(stream):
+    """(status, headers, body) of the next response on `stream`, or None at end of stream."""
+    status_line = stream.readline()
+    if not status_line:
+        return None
+    headers = {}
+    for line in iter(stream.readline, b'\r\n'):
+        name, _, value = line.decode('iso-8859-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return int(status_line.split()[1]), headers, stream.read(int(headers.get('content-length', 0)))
+
+
+@contextlib.contextmanager
+def connection(port):
+    with socket.create_connection(('127.0.0.1', port), timeout=10) as sock:
+        with sock.makefile('rb') as stream:
+            yield sock, stream
+
+
+def response_json(conn):
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_asyncio_long_polls_do_not_hold_executor_threads():
+    app = functools.partial(simple_server.handle_http_request, defer=True)
+    purchases = [simple_server.PURCHASES.create() for _ in range(20)]
+    paid = simple_server.PURCHASES.create(sender='0xpayer')
+    token = simple_server.issue_token()
+    with asyncio_server(app, threads=2) as port:
+        polls = []
+        for purchase in purchases:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            post(conn, rpc('purchase_status', {'purchase_id': purchase.purchase_id, 'wait': 1.5}))
+            polls.append(conn)
+        waiter = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        post(waiter, rpc('purchase_status', {'purchase_id': paid.purchase_id, 'wait': 5}))
+        time.sleep(0.2)
+
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        started = time.perf_counter()
+        post(conn, rpc('echo', [token, 'hi']))
+        assert response_json(conn) == (200, {'jsonrpc': '2.0', 'result': 'Dear User, hi', 'id': 1})
+        assert time.perf_counter() - started < 1.0
+
+        # A payment from the expected sender wakes its long-poll on the event loop
+        simple_server.record_payment('digest-long-poll', int(time.time() * 1000), '0xpayer', 10**9, backfill=False)
+        status, response = response_json(waiter)
+        assert status == 200 and response['result']['status'] == 'completed' and response['result']['token']
+        for poll in polls:
+            status, response = response_json(poll)
+            assert status == 200 and response['result']['status'] == 'pending'
+        for c in (conn, waiter, *polls):
+            c.close()
+
+
+def test_purchases_are_refused_in_prefork_mode(monkeypatch):
+    monkeypatch.setattr(simple_server, 'PURCHASES_ENABLED', False)
+    status, headers, payload = simple_server.handle_http_request('POST', '/', rpc('request_purchase'))
+    assert status == 501 and json.loads(payload)['error']['code'] == -32006
+    status, _, payload = simple_server.handle_http_request('POST', '/', rpc('purchase_status', ['anything']))
+    assert status == 501 and json.loads(payload)['error']['code'] == -32006
+    assert simple_server.handle_http_request('GET', '/purchases/anything/events', b'')[0] == 501
+
+
+def test_keep_alive_and_pipelined_requests_are_answered_in_order(engine_port):
+    token = simple_server.issue_token()
+    with connection(engine_port) as (sock, stream):
+        sock.sendall(raw_request(rpc('echo', [token, 'first'], rpc_id=1)))
+        status, headers, body = read_response(stream)
+        assert status == 200 and 'connection' not in headers
+        assert json.loads(body)['result'] == 'Dear User, first'
+        # Three requests in one write, on the same connection
+        sock.sendall(b''.join(raw_request(rpc('echo', [token, str(i)], rpc_id=i)) for i in range(3)))
+        assert [json.loads(read_response(stream)[2])['id'] for _ in range(3)] == [0, 1, 2]
+
+
+def test_connection_closes_after_max_requests(engine_port, monkeypatch):
+    monkeypatch.setattr(server_engines, 'MAX_REQUESTS_PER_CONNECTION', 3)
+    with connection(engine_port) as (sock, stream):
+        sock.sendall(raw_request(rpc('no_such_method')) * 4)
+        responses = [read_response(stream) for _ in range(4)]
+    assert [response[0] for response in responses[:3]] == [400, 400, 400]
+    assert responses[2][1]['connection'] == 'close' and responses[3] is None
+
+
+def test_expect_100_continue_gets_an_interim_response(engine_port):
+    token = simple_server.issue_token()
+    body = rpc('echo', [token, 'hi'])
+    request = raw_request(body, headers=['Expect: 100-continue'])
+    with connection(engine_port) as (sock, stream):
+        sock.settimeout(0.5)  # the client must not have to time out waiting for the go-ahead
+        sock.sendall(request[:-len(body)])
+        assert read_response(stream) == (100, {}, b'')
+        sock.sendall(body)
+        status, _, payload = read_response(stream)
+    assert status == 200 and json.loads(payload)['result'] == 'Dear User, hi'
+
+
+@pytest.mark.parametrize('headers, status', [
+    (['Content-Length: 2000000'], 413),
+    (['Content-Length: 1_0'], 400),
+    (['Content-Length: 5', 'Content-Length: 6'], 400),
+    (['Transfer-Encoding: chunked'], 501),
+    (['Content-Length: 2', 'Transfer-Encoding: chunked'], 501),
+])
+def test_bad_framing_is_refused_and_closes_the_connection(engine_port, headers, status):
+    token = simple_server.issue_token()
+    smuggled = raw_request(rpc('echo', [token, 'smuggled']))
+    with connection(engine_port) as (sock, stream):
+        # With chunked framing, a server that ignored it would answer the smuggled request too
+        sock.sendall(raw_request(b'', headers) + f'{len(smuggled):x}\r\n'.encode('ascii') + smuggled + b'\r\n0\r\n\r\n')
+        refused = read_response(stream)
+        assert refused[0] == status and refused[1]['connection'] == 'close'
+        assert read_response(stream) is None
+
+
+def post_batch(batch):
+    status, headers, payload = simple_server.handle_http_request('POST', '/', json.dumps(batch).encode('utf-8'))
+    return status, json.loads(payload) if payload else None
+
+
+def test_batch_results_keep_request_order_and_skip_notifications():
+    token = simple_server.issue_token()
+    batch = [{'jsonrpc': '2.0', 'method': 'echo', 'params': [token, str(i)], 'id': i} for i in range(10)]
+    batch.insert(3, {'jsonrpc': '2.0', 'method': 'echo', 'params': [token, 'note']})
+    status, responses = post_batch(batch)
+    assert status == 200
+    assert [(r['id'], r['result']) for r in responses] == [(i, f'Dear User, {i}') for i in range(10)]
+    notifications = [{'jsonrpc': '2.0', 'method': 'get_time', 'params': [token]} for _ in range(3)]
+    assert post_batch(notifications) == (204, None)
+
+
+def test_invalid_batches():
+    assert post_batch([]) == (400, {'jsonrpc': '2.0', 'error': {'code': -32600, 'message': 'Invalid Request'}, 'id': None})
+    status, response = post_batch([{'jsonrpc': '2.0', 'method': 'get_time', 'id': 1}] * (simple_server.MAX_BATCH_SIZE + 1))
+    assert status == 400 and response['error']['code'] == -32600 and response['id'] is None
+    status, responses = post_batch([1, 'two', [3], None])
+    assert status == 200 and len(responses) == 4
+    assert all(r['error']['code'] == -32600 and r['id'] is None for r in responses)
+
+
+def test_long_polls_in_batches_do_not_hold_batch_threads(monkeypatch):
+    monkeypatch.setattr(simple_server, 'BATCH_EXECUTOR', ThreadPoolExecutor(max_workers=2))
+    purchase = simple_server.PURCHASES.create()
+    poll = {'jsonrpc': '2.0', 'method': 'purchase_status', 'params': {'purchase_id': purchase.purchase_id, 'wait': 1}}
+    with ThreadPoolExecutor(max_workers=2) as clients:
+        # Four waiting elements for two batch threads
+        polls = [clients.submit(post_batch, [dict(poll, id=1), dict(poll, id=2)]) for _ in range(2)]
+        time.sleep(0.2)
+        token = simple_server.issue_token()
+        started = time.perf_counter()
+        status, responses = post_batch([{'jsonrpc': '2.0', 'method': 'echo', 'params': [token, str(i)], 'id': i}
+                                        for i in range(2)])
+        assert status == 200 and [r['result'] for r in responses] == ['Dear User, 0', 'Dear User, 1']
+        assert time.perf_counter() - started < 0.5
+        for future in polls:
+            status, responses = future.result()
+            assert status == 200 and [r['result']['status'] for r in responses] == ['pending', 'pending']
+
+    body = json.dumps([dict(poll, id=1), {'jsonrpc': '2.0', 'method': 'no_such_method', 'id': 2}]).encode('utf-8')
+    deferred = simple_server.handle_http_request('POST', '/', body, defer=True)
+    assert inspect.isawaitable(deferred)
+    status, _, payload = asyncio.run(deferred)
+    assert status == 200 and [r['id'] for r in json.loads(payload)] == [1, 2]
+
+
+def test_batch_validates_a_shared_token_once(monkeypatch):
+    token = simple_server.issue_token()
+    calls = []
+    validator = simple_server.TOKEN_VALIDATOR
+
+    class CountingValidator:
+        def validate(self, token):
+            calls.append(token)
+            return validator.validate(token)
+    monkeypatch.setattr(simple_server, 'TOKEN_VALIDATOR', CountingValidator())
+    batch = [{'jsonrpc': '2.0', 'method': 'get_time', 'params': [token], 'id': i} for i in range(8)]
+    batch.append({'jsonrpc': '2.0', 'method': 'get_time', 'params': ['not-a-jwt'], 'id': 8})
+    status, responses = post_batch(batch)
+    assert status == 200 and all('result' in r for r in responses[:8])
+    assert responses[8]['error']['message'] == 'No access: Invalid token'
+    assert sorted(calls) == sorted(['not-a-jwt', token])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _serve_with_slow_method(mode, port):
+    @simple_server.REGISTRY.method('sleep')
+    def rpc_sleep(ctx, seconds: float):
+        time.sleep(seconds)
+        return seconds
+
+    if mode == 'threaded':
+        server_engines.serve_threaded('127.0.0.1', port, simple_server.JSONRPCRequestHandler)
+    else:
+        server_engines.serve_asyncio('127.0.0.1', port, functools.partial(simple_server.handle_http_request, defer=True))
+
+
+@pytest.mark.parametrize('mode', ['threaded', 'asyncio'])
+def test_slow_handler_does_not_block_get_time(mode):
+    port = free_port()
+    token = simple_server.issue_token()  # before the fork: the memory token store is per process
+    server = multiprocessing.get_context('fork').Process(target=_serve_with_slow_method, args=(mode, port), daemon=True)
+    server.start()
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                assert time.monotonic() < deadline, f'{mode} server did not start'
+                time.sleep(0.02)
+        slow = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        post(slow, rpc('sleep', [1.5]))
+        time.sleep(0.1)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        started = time.perf_counter()
+        post(conn, rpc('get_time', [token]))
+        status, response = response_json(conn)
+        assert status == 200 and response['result'].endswith('GMT')
+        assert time.perf_counter() - started < 0.5
+        assert response_json(slow) == (200, {'jsonrpc': '2.0', 'result': 1.5, 'id': 1})
+        slow.close()
+        conn.close()
+    finally:
+        server.terminate()
+        server.join()
+
+
+def test_prefork_fails_before_forking_when_port_is_taken():
+    with socket.socket() as taken:
+        taken.bind(('127.0.0.1', 0))
+        taken.listen()
+        with pytest.raises(OSError):
+            server_engines.serve_prefork('127.0.0.1', taken.getsockname()[1], simple_server.JSONRPCRequestHandler,
+                                         workers=2)
+
+
+def _prefork_with_failing_start(port):
+    def fail():
+        raise RuntimeError('cannot start')
+    server_engines.serve_prefork('127.0.0.1', port, simple_server.JSONRPCRequestHandler, workers=2, on_start=fail)
+
+
+def test_prefork_gives_up_when_workers_keep_dying_at_startup(monkeypatch):
+    monkeypatch.setattr(server_engines, 'RESPAWN_BACKOFF_SECONDS', 0.01)
+    supervisor = multiprocessing.get_context('fork').Process(target=_prefork_with_failing_start, args=(free_port(),))
+    started = time.monotonic()
+    supervisor.start()
+    try:
+        supervisor.join(10)
+        assert supervisor.exitcode == 1
+        assert time.monotonic() - started < 5
+    finally:
+        supervisor.kill()
+        supervisor.join()
+
+
+def test_echo_and_get_time_ignore_surplus_params():
+    token = simple_server.issue_token()
+    status, response = simple_server.handle_rpc_payload(rpc('echo', [token, 'a', 'b']))
+    assert (status, response['result']) == (200, 'Dear User, a')
+    status, response = simple_server.handle_rpc_payload(rpc('get_time', [token, 'x']))
+    assert status == 200 and response['result'].endswith('GMT')
+
+
+def test_method_tier_is_keyed_on_client_and_token_id(monkeypatch):
+    monkeypatch.setattr(simple_server, 'RATE_LIMITER', RateLimiter({'echo': (0.01, 2)}))
+    token = simple_server.issue_token()
+    header, payload, _ = token.split('.')
+    forged = f'{header}.{payload}.forged-signature'
+
+    def echo(token, client):
+        return simple_server.handle_rpc_payload(rpc('echo', [token]), client)[0]
+    # Another client replaying the token_id with a bad signature can't drain the owner's bucket
+    assert [echo(forged, '10.0.0.2') for _ in range(3)] == [401, 401, 429]
+    assert [echo(token, '10.0.0.1') for _ in range(3)] == [200, 200, 429]
+    # The same token from another address has its own bucket
+    assert echo(token, '10.0.0.3') == 200
+
+
+def test_declared_settings_match_their_defaults(tmp_path):
+    import server_config
+    defaults = {name: getattr(simple_server, name) for name in simple_server.SETTINGS}
+    path = tmp_path / 'server.json'
+    path.write_text(json.dumps(defaults))
+    loaded = server_config.load_config(simple_server.SETTINGS, {'MCP_CONFIG_FILE': str(path)},
+                                       simple_server.SETTING_CHECKS)
+    assert loaded.keys() == defaults.keys() and json.dumps(loaded) == json.dumps(defaults)
+    for environ in ({'MCP_MIN_PAYMENT_MIST': '"1000"'}, {'MCP_SERVER_MODE': 'forking'},
+                    {'MCP_RATE_LIMIT_METHODS': '{"echo": [10]}'}):
+        with pytest.raises(server_config.ConfigError):
+            server_config.load_config(simple_server.SETTINGS, environ, simple_server.SETTING_CHECKS)
+
+
+def test_threaded_response_headers():
+    with threaded_server() as port, connection(port) as (sock, stream):
+        sock.sendall(raw_request(rpc('no_such_method')))
+        status, headers, body = read_response(stream)
+    assert status == 400 and headers['content-type'] == 'application/json'
+    assert headers['server'].startswith('BaseHTTP') and headers['date'].endswith('GMT')
+    assert int(headers['content-length']) == len(body) and json.loads(body)['error']['code'] == -32601
+
+
+@pytest.fixture
+def fake_chain():
+    """A fake fullnode that already holds three payments to the monitored address."""
+    node = FakeSuiNode(PaymentStream(rate=0, backfill=3, seed=1))
+    server = start_fake_node(node)
+    yield node, f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def start_payments(monkeypatch, url, ledger):
+    """Point simple_server's payment handling at `ledger` and a new indexer on `url`, and sync once."""
+    access = SuiAccess(url)
+    indexer = SuiPaymentIndexer(access, simple_server.SUI_ADDRESS_TO_MONITOR, on_payment=simple_server.record_payment,
+                                on_sync=simple_server.index_synced, is_known=ledger.__contains__, freshness=0)
+    monkeypatch.setattr(simple_server, 'SUI_ACCESS', access)
+    monkeypatch.setattr(simple_server, 'PAYMENT_LEDGER', ledger)
+    monkeypatch.setattr(simple_server, 'PAYMENT_INDEXER', indexer)
+    ledger.reset_synced()
+    indexer.sync_once()
+    return indexer
+
+
+def purchase(**params):
+    """(HTTP status, JSON-RPC error code or None) of a purchase_token call."""
+    status, _, payload = simple_server.handle_http_request('POST', '/', rpc('purchase_token', params))
+    return status, json.loads(payload).get('error', {}).get('code')
+
+
+def test_purchase_token_before_the_first_sync(monkeypatch, fake_chain):
+    node, url = fake_chain
+    access = SuiAccess(url, retries=1, backoff=0, breaker=CircuitBreaker(failure_threshold=1))
+    monkeypatch.setattr(simple_server, 'SUI_ACCESS', access)
+    monkeypatch.setattr(simple_server, 'PAYMENT_LEDGER', PaymentLedger())
+    assert purchase() == (503, -32000)
+    access.breaker.record_failure()
+    assert access.degraded
+    assert purchase() == (503, -32002)
+
+
+def test_purchase_token_with_a_stale_index(monkeypatch, fake_chain):
+    node, url = fake_chain
+    start_payments(monkeypatch, url, PaymentLedger())
+    node.error_rate = 1.0  # the catch-up sync on a miss fails
+    monkeypatch.setattr(simple_server, 'INDEX_STALE_SECONDS', 0.01)
+    time.sleep(0.02)
+    assert purchase() == (503, -32002)
+    assert not simple_server.SUI_ACCESS.degraded
+
+
+def test_purchase_token_claims_each_payment_once(monkeypatch, fake_chain):
+    node, url = fake_chain
+    start_payments(monkeypatch, url, PaymentLedger())
+    assert purchase() == (402, -32001)  # backfilled payments predate the server
+    first = node.stream.add(sender='0xpayer')
+    second = node.stream.add(sender='0xpayer')
+
+    status, _, payload = simple_server.handle_http_request('POST', '/', rpc('purchase_token', {'digest': second}))
+    assert status == 200
+    assert simple_server.TOKEN_VALIDATOR.validate(json.loads(payload)['result'])
+    assert purchase(digest=second) == (402, -32001)
+    assert purchase(digest='unknown-digest') == (402, -32001)
+    assert purchase(sender='0xsomeone-else') == (402, -32001)
+    assert purchase(sender='0xpayer') == (200, None)
+    assert purchase(digest=first) == (402, -32001)
+    assert purchase() == (402, -32001)
+
+
+def test_new_sqlite_ledger_does_not_redeem_earlier_payments(monkeypatch, fake_chain, tmp_path):
+    node, url = fake_chain
+    path = str(tmp_path / 'state.db')
+    start_payments(monkeypatch, url, SQLitePaymentLedger(path))
+    assert purchase() == (402, -32001)
+    node.stream.add()
+    assert purchase() == (200, None)
+
+    # A payment made while the server is down is backfilled on restart, and stays claimable
+    node.stream.add()
+    start_payments(monkeypatch, url, SQLitePaymentLedger(path))
+    assert purchase() == (200, None)
+    assert purchase() == (402, -32001)
@@ -0,0 +1,50 @@
+import threading
+import time
+import pytest
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return len(calls)
+    flight = SingleFlight(slow)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight())) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [1] * 20 and flight.executions == 1
+
+
+def test_result_reused_within_max_age_only():
+    now = [0.0]
+    counter = iter(range(100))
+    flight = SingleFlight(lambda: next(counter), clock=lambda: now[0])
+    assert flight(max_age=1.0) == 0
+    now[0] = 0.5
+    assert flight(max_age=1.0) == 0
+    assert flight(max_age=0.25) == 1
+    now[0] = 2.0
+    assert flight(max_age=1.0) == 2
+
+
+def test_failures_are_not_cached():
+    outcomes = [RuntimeError('down'), 'ok']
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    flight = SingleFlight(flaky)
+    with pytest.raises(RuntimeError):
+        flight(max_age=60)
+    assert flight(max_age=60) == 'ok'
@@ -0,0 +1,76 @@
+import pytest
+from pysui import SuiRpcResult
+from sui_access import SuiAccess, SuiUnavailableError, CircuitBreaker
+
+
+class FakeClient:
+    def __init__(self, results):
+        self.results = results
+        self.closed = False
+
+    def execute(self, builder):
+        return self.results.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+def access_with(results, **kwargs):
+    created = []
+
+    def factory():
+        client = FakeClient(results)
+        created.append(client)
+        return client
+    kwargs.setdefault('backoff', 0)
+    return SuiAccess('http://fullnode.invalid', client_factory=factory, **kwargs), created
+
+
+def test_transport_error_is_retried_on_a_fresh_client():
+    access, created = access_with([SuiRpcResult(False, 'HTTPX error: ConnectError'), SuiRpcResult(True, None, 'ok')])
+    assert access.execute(object()).result_data == 'ok'
+    assert len(created) == 2 and created[0].closed
+    assert not access.degraded
+
+
+def test_node_errors_are_returned_without_retry():
+    access, created = access_with([SuiRpcResult(False, {'code': -32602, 'message': 'bad params'})])
+    result = access.execute(object())
+    assert result.is_err() and result.result_string['code'] == -32602
+    assert len(created) == 1 and not created[0].closed
+
+
+def test_circuit_opens_then_fails_fast_until_probe_succeeds():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=lambda: now[0])
+    failures = [SuiRpcResult(False, 'HTTPX error: ReadTimeout')] * 3
+    access, created = access_with(failures + [SuiRpcResult(True, None, 'ok')], retries=2, breaker=breaker)
+    with pytest.raises(SuiUnavailableError):
+        access.execute(object())
+    assert access.degraded
+    with pytest.raises(SuiUnavailableError, match='circuit open'):
+        access.execute(object())
+    assert len(created) == 3
+
+    now[0] = 31
+    assert access.execute(object()).result_data == 'ok'
+    assert not access.degraded
+
+
+def test_failed_probe_reopens_circuit():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 31
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe while half-open
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+
+def test_connect_failure_counts_as_transport_error():
+    def factory():
+        raise OSError('connection refused')
+    access = SuiAccess('http://fullnode.invalid', retries=0, client_factory=factory)
+    with pytest.raises(SuiUnavailableError, match='connect failed'):
+        access.execute(object())
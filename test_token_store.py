@@ -0,0 +1,63 @@
+import multiprocessing
+import time
+import pytest
+from token_store import TokenStore, MemoryTokenStore, SQLiteTokenStore, open_token_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    store = open_token_store(request.param, str(tmp_path / 'tokens.db'))
+    yield store
+    store.close()
+
+
+def test_add_lookup_remove(store):
+    now = int(time.time())
+    store.add('t1', now, now + 3600)
+    assert 't1' in store
+    assert store.expires_at('t1') == now + 3600
+    assert store.created_at('t1') == now
+    assert store.expires_at('missing') is None
+    store.remove('t1')
+    assert 't1' not in store
+    assert len(store) == 0
+
+
+def test_purge_expired(store):
+    now = int(time.time())
+    store.add('old', now - 10, now - 1)
+    store.add('new', now, now + 60)
+    assert store.purge_expired(now) == 1
+    assert 'old' not in store and 'new' in store
+
+
+def _add_from_child(path):
+    child = SQLiteTokenStore(path)
+    child.add('from-child', 1, 2 ** 32)
+    child.close()
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'tokens.db')
+    parent = SQLiteTokenStore(path)
+    process = multiprocessing.get_context('fork').Process(target=_add_from_child, args=(path,))
+    process.start()
+    process.join()
+    assert parent.expires_at('from-child') == 2 ** 32
+    parent.close()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        open_token_store('redis')
+    assert isinstance(open_token_store('memory'), MemoryTokenStore)
+
+
+def test_token_store_is_abstract():
+    class Partial(TokenStore):
+        def add(self, token_id, created_at, expires_at):
+            pass
+
+    for cls in (TokenStore, Partial):
+        with pytest.raises(TypeError):
+            cls()
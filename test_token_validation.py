@@ -0,0 +1,81 @@
+import time
+import uuid
+import jwt
+import pytest
+from token_store import MemoryTokenStore
+from token_validation import TokenValidator, TokenExpirySweeper, VerifiedTokenCache
+
+SECRET = 'test-secret'
+
+
+def issue(store, lifetime=3600):
+    token_id = str(uuid.uuid4())
+    expiration = int(time.time()) + lifetime
+    store.add(token_id, time.time(), expiration)
+    return token_id, jwt.encode({'token_id': token_id, 'exp': expiration}, SECRET, algorithm='HS256')
+
+
+def test_repeat_validation_skips_jwt_decode(monkeypatch):
+    store = MemoryTokenStore()
+    token_id, token = issue(store)
+    validator = TokenValidator(SECRET, store)
+    assert validator.validate(token) == token_id
+
+    def fail(*args, **kwargs):
+        raise AssertionError('jwt.decode called on a cached token')
+    monkeypatch.setattr(jwt, 'decode', fail)
+    assert validator.validate(token) == token_id
+    assert validator.cache.stats() == {'size': 1, 'hits': 1, 'misses': 1}
+
+
+def test_removed_token_is_rejected_even_when_cached():
+    store = MemoryTokenStore()
+    token_id, token = issue(store)
+    validator = TokenValidator(SECRET, store)
+    validator.validate(token)
+    store.remove(token_id)
+    with pytest.raises(jwt.InvalidTokenError):
+        validator.validate(token)
+    assert len(validator.cache) == 0
+
+
+def test_expired_server_record_is_rejected_and_dropped():
+    store = MemoryTokenStore()
+    token_id, token = issue(store)
+    store.add(token_id, time.time(), time.time() - 1)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        TokenValidator(SECRET, store).validate(token)
+    assert token_id not in store
+
+
+def test_invalid_tokens():
+    validator = TokenValidator(SECRET, MemoryTokenStore())
+    for bad in ('not-a-jwt', 42, jwt.encode({'token_id': 'x'}, SECRET, algorithm='HS256')):
+        with pytest.raises(jwt.InvalidTokenError):
+            validator.validate(bad)
+
+
+def test_cache_is_bounded_lru():
+    cache = VerifiedTokenCache(max_size=2)
+    far = time.time() + 60
+    cache.put('a', 1, far)
+    cache.put('b', 2, far)
+    assert cache.get('a') == 1
+    cache.put('c', 3, far)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    cache.put('d', 4, time.time() - 1)
+    assert cache.get('d') is None
+
+
+def test_sweeper_expires_due_tokens_only():
+    store = MemoryTokenStore()
+    now = time.time()
+    store.add('old', now, now - 1)
+    store.add('new', now, now + 60)
+    sweeper = TokenExpirySweeper(store.remove)
+    sweeper.schedule('new', now + 60)
+    sweeper.schedule('old', now - 1)
+    assert sweeper.sweep(now) == 1
+    assert 'old' not in store and 'new' in store
+    assert len(sweeper) == 1
@@ -0,0 +1,171 @@
+import abc
+import os
+import sqlite3
+import threading
+import time
+
+TOKEN_STORE_BACKENDS = ('memory', 'sqlite')
+
+_EPOCH_BITS = 40
+_EPOCH_MASK = (1 << _EPOCH_BITS) - 1
+
+
+class TokenStore(abc.ABC):
+    """Issued-token records: token_id -> (created_at, expires_at) as epoch seconds."""
+
+    @abc.abstractmethod
+    def add(self, token_id, created_at, expires_at):
+        """Record a newly issued token."""
+
+    @abc.abstractmethod
+    def expires_at(self, token_id):
+        """Return the expiry epoch of a token, or None if it is unknown."""
+
+    @abc.abstractmethod
+    def created_at(self, token_id):
+        """Return the issue epoch of a token, or None if it is unknown."""
+
+    @abc.abstractmethod
+    def remove(self, token_id):
+        """Forget a token; unknown ids are ignored."""
+
+    @abc.abstractmethod
+    def purge_expired(self, now=None):
+        """Delete every expired record. Returns the number removed."""
+
+    def __contains__(self, token_id):
+        return self.expires_at(token_id) is not None
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Number of records held."""
+
+    def close(self):
+        pass
+
+
+class MemoryTokenStore(TokenStore):
+    """Process-local store packing each record into a single int.
+
+    (created_at << 40) | expires_at takes one small int object per token
+    instead of a dict holding two datetimes.
+    """
+
+    def __init__(self):
+        self._records = {}
+
+    def add(self, token_id, created_at, expires_at):
+        self._records[token_id] = (int(created_at) << _EPOCH_BITS) | int(expires_at)
+
+    def expires_at(self, token_id):
+        packed = self._records.get(token_id)
+        return None if packed is None else packed & _EPOCH_MASK
+
+    def created_at(self, token_id):
+        packed = self._records.get(token_id)
+        return None if packed is None else packed >> _EPOCH_BITS
+
+    def remove(self, token_id):
+        self._records.pop(token_id, None)
+
+    def purge_expired(self, now=None):
+        now = now if now is not None else time.time()
+        expired = [token_id for token_id, packed in self._records.items() if packed & _EPOCH_MASK < now]
+        for token_id in expired:
+            self._records.pop(token_id, None)
+        return len(expired)
+
+    def __contains__(self, token_id):
+        return token_id in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+
+class SQLiteConnections:
+    """One autocommit connection to a SQLite file per thread and per process.
+
+    Connections are not carried across fork(): a forked worker opens its own.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # autocommit: every statement is its own transaction
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class SQLiteTokenStore(TokenStore):
+    """On-disk store in WAL mode, shareable by several server processes.
+
+    Each thread (and each forked worker) gets its own connection. Lookups are
+    primary-key reads against a WITHOUT ROWID table, and nothing has to be
+    reloaded at startup: a restarted worker simply reopens the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connections = SQLiteConnections(path)
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tokens ('
+            ' token_id TEXT PRIMARY KEY,'
+            ' created_at INTEGER NOT NULL,'
+            ' expires_at INTEGER NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS tokens_expires_at ON tokens (expires_at)')
+
+    def _connect(self):
+        return self._connections.get()
+
+    def add(self, token_id, created_at, expires_at):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO tokens (token_id, created_at, expires_at) VALUES (?, ?, ?)',
+            (token_id, int(created_at), int(expires_at))
+        )
+
+    def expires_at(self, token_id):
+        row = self._connect().execute('SELECT expires_at FROM tokens WHERE token_id = ?', (token_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def created_at(self, token_id):
+        row = self._connect().execute('SELECT created_at FROM tokens WHERE token_id = ?', (token_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def remove(self, token_id):
+        self._connect().execute('DELETE FROM tokens WHERE token_id = ?', (token_id,))
+
+    def purge_expired(self, now=None):
+        now = now if now is not None else time.time()
+        return self._connect().execute('DELETE FROM tokens WHERE expires_at < ?', (int(now),)).rowcount
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+
+    def close(self):
+        self._connections.close()
+
+
+def open_token_store(backend, path=None):
+    """Build the token store selected by TOKEN_STORE_BACKEND."""
+    if backend == 'memory':
+        return MemoryTokenStore()
+    if backend == 'sqlite':
+        return SQLiteTokenStore(path)
+    raise ValueError(f"Unknown token store backend: {backend}")
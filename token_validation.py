@@ -0,0 +1,172 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+import jwt
+
+# Maximum number of verified token strings kept in the cache
+CACHE_MAX_SIZE = 100000
+# Seconds between sweeps of expired tokens out of the token store
+SWEEP_INTERVAL_SECONDS = 1.0
+
+
+class VerifiedTokenCache:
+    """LRU cache of token strings whose signature has already been verified.
+
+    Maps the raw JWT string to (token_id, expires_epoch). An entry is only
+    returned while it is unexpired, so a hit can skip jwt.decode entirely.
+    """
+
+    def __init__(self, max_size=CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token, now=None):
+        """Return the cached token_id, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                if entry[1] > (now if now is not None else time.time()):
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def put(self, token, token_id, expires_epoch):
+        with self._lock:
+            self._entries[token] = (token_id, expires_epoch)
+            self._entries.move_to_end(token)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class TokenExpirySweeper:
+    """Heap of (expires_epoch, token_id) drained by a background thread.
+
+    Every issued token is scheduled once; each sweep pops the tokens whose
+    expiry has passed and hands them to `on_expire`, so the token store shrinks
+    without waiting for an expired token to be presented again.
+    """
+
+    def __init__(self, on_expire, interval=SWEEP_INTERVAL_SECONDS):
+        self.on_expire = on_expire
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._heap = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, token_id, expires_epoch):
+        with self._lock:
+            heapq.heappush(self._heap, (expires_epoch, token_id))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='token-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def sweep(self, now=None):
+        """Expire every due token. Returns the number removed."""
+        now = now if now is not None else time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expired.append(heapq.heappop(self._heap)[1])
+        for token_id in expired:
+            self.on_expire(token_id)
+        return len(expired)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sweep()
+
+
+class TokenValidator:
+    """Validates access tokens against the issued-token store.
+
+    The first time a token string is seen it is verified with jwt.decode and
+    checked against the store; the result is cached so repeat calls only cost a
+    cache lookup and a store membership check (which still catches tokens the
+    sweeper has removed). Raises jwt.ExpiredSignatureError or
+    jwt.InvalidTokenError like jwt.decode does.
+    """
+
+    def __init__(self, secret_key, issued_tokens, cache=None):
+        # issued_tokens is a token_store.TokenStore
+        self.secret_key = secret_key
+        self.issued_tokens = issued_tokens
+        self.cache = cache if cache is not None else VerifiedTokenCache()
+
+    def validate(self, token):
+        """Return the token_id of a valid token."""
+        if not isinstance(token, str):
+            raise jwt.InvalidTokenError("Token must be a string")
+        now = time.time()
+        token_id = self.cache.get(token, now)
+        if token_id is not None:
+            if token_id in self.issued_tokens:
+                return token_id
+            self.cache.discard(token)
+            raise jwt.InvalidTokenError("Token not found in issued tokens")
+
+        payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+        token_id = payload.get('token_id')
+        expires_epoch = self.issued_tokens.expires_at(token_id)
+        if expires_epoch is None:
+            raise jwt.InvalidTokenError("Token not found in issued tokens")
+
+        if expires_epoch < now:
+            self.issued_tokens.remove(token_id)  # Clean up expired token from the store
+            raise jwt.ExpiredSignatureError("Token has expired based on server record")
+
+        self.cache.put(token, token_id, min(expires_epoch, payload.get('exp', expires_epoch)))
+        return token_id
+
+
+class BatchTokenValidator:
+    """Memoises TokenValidator results for the lifetime of one JSON-RPC batch.
+
+    Batch elements usually carry the same token; it is validated once and the
+    outcome (token_id or the raised error) is shared by every element, even
+    when the elements run in parallel.
+    """
+
+    def __init__(self, validator):
+        self.validator = validator
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def validate(self, token):
+        if not isinstance(token, str):
+            return self.validator.validate(token)
+        with self._lock:
+            if token not in self._results:
+                try:
+                    self._results[token] = (self.validator.validate(token), None)
+                except jwt.InvalidTokenError as e:
+                    self._results[token] = (None, e)
+            token_id, error = self._results[token]
+        if error is not None:
+            raise error
+        return token_id